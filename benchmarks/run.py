@@ -0,0 +1,356 @@
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bio_optimization import abc_search, ga, multimodal, niching, nsga2, pareto_search
+from bio_optimization.rng import generator
+
+# Scaling benchmarks for the optimizer kernels, full generations and the UNet input pipeline.
+#
+#   python benchmarks/run.py run --output benchmarks/results/$(git rev-parse --short HEAD).json
+#   python benchmarks/run.py compare old.json new.json
+#   python benchmarks/run.py plot new.json
+#   python benchmarks/run.py inference --model unet.keras --threads 1 2 4
+#
+# Every case is set up outside the timed call, from a generator seeded the same way on every run so
+# compare() sees the same inputs. Sizes are run in increasing order and a case stops
+# growing once one call takes longer than --max-seconds, so the quadratic kernels don't run for days.
+
+SIZES = [10**2, 10**3, 10**4, 10**5, 10**6]
+DIMS = [2, 10, 100, 1000]
+
+CASES = {}
+
+
+def case(name, dims=True, max_n=None, group='kernel'):
+    def register(setup):
+        CASES[name] = {'setup': setup, 'dims': dims, 'max_n': max_n, 'group': group}
+        return setup
+    return register
+
+
+def _nsga2_pop(n, d, rng):
+    x_min, x_max = np.zeros((1, d)), np.ones((1, d))
+    return nsga2.initialpop(n, d, 2, x_max, x_min, rng), x_max, x_min
+
+
+def _multimodal_pop(n, d, rng):
+    chromo = np.zeros([n, d + 3])
+    chromo[:, 0:d] = rng.uniform(-3, 3, (n, d))
+    chromo[:, d] = multimodal.function(chromo[:, 0:d])
+    return chromo
+
+
+@case('ga.GASelect', dims=False)
+def _(n, d, rng):
+    parents = ga.GAEncode(ga.oringinalPopulation(n, rng=rng))
+    fitness = ga.fx(ga.GADecode(parents))
+    return lambda: ga.GASelect(parents, fitness, rng=rng)
+
+
+@case('ga.generation', dims=False, group='generation')
+def _(n, d, rng):
+    parents = ga.GAEncode(ga.oringinalPopulation(n, rng=rng))
+    return lambda: ga.GAMutate(ga.GACrossover(ga.GASelect(parents, ga.fx(ga.GADecode(parents)), rng=rng), rng=rng), rng=rng)
+
+
+@case('nsga2.nondominsort')
+def _(n, d, rng):
+    chromo, x_max, x_min = _nsga2_pop(n, d, rng)
+    return lambda: nsga2.nondominsort(chromo, n, d, 2, x_max, x_min)
+
+
+@case('nsga2.crowddissort')
+def _(n, d, rng):
+    chromo, x_max, x_min = _nsga2_pop(n, d, rng)
+    F = nsga2.nondominsort(chromo, n, d, 2, x_max, x_min)
+    return lambda: nsga2.crowddissort(chromo, F, n, d, 2, x_max, x_min)
+
+
+@case('nsga2.elitism')
+def _(n, d, rng):
+    chromo, x_max, x_min = _nsga2_pop(2 * n, d, rng)
+    F = nsga2.nondominsort(chromo, 2 * n, d, 2, x_max, x_min)
+    chromo = nsga2.crowddissort(chromo, F, 2 * n, d, 2, x_max, x_min)
+    return lambda: nsga2.elitism(chromo, n, d, 2, x_max, x_min)
+
+
+@case('nsga2.generation', group='generation')
+def _(n, d, rng):
+    chromo, x_max, x_min = _nsga2_pop(n, d, rng)
+    F = nsga2.nondominsort(chromo, n, d, 2, x_max, x_min)
+    chromo = nsga2.crowddissort(chromo, F, n, d, 2, x_max, x_min)
+    return lambda: nsga2.generation(chromo.copy(), F, 0.9, 1 / d, 20, 20, n, d, 2, x_max, x_min, rng)
+
+
+@case('pareto_search.nondominsort', dims=False, max_n=10**4)
+def _(n, d, rng):
+    # Dense domination matrix, n^2 booleans per objective
+    objs = rng.random((n, 3))
+    return lambda: pareto_search.nondominsort(objs)
+
+
+@case('multimodal.sharingfitness')
+def _(n, d, rng):
+    chromo = _multimodal_pop(n, d, rng)
+    return lambda: multimodal.sharingfitness(chromo, d, 0.7, 1)
+
+
+@case('niching.nicheseeds')
+def _(n, d, rng):
+    chromo = _multimodal_pop(n, d, rng)
+    return lambda: niching.nicheseeds(chromo, d, 0.7)
+
+
+@case('niching.clearing')
+def _(n, d, rng):
+    chromo = _multimodal_pop(n, d, rng)
+    return lambda: niching.clearing(chromo, d, 0.7, 1)
+
+
+@case('multimodal.generation', group='generation')
+def _(n, d, rng):
+    chromo = _multimodal_pop(n, d, rng)
+    x_max, x_min = np.ones([1, d]) * 3, np.ones([1, d]) * -3
+
+    def generation():
+        chromo_off = multimodal.mutation(multimodal.crossover(chromo, 0.9, 20, n, d, x_max, x_min, rng), 1 / d, 20, n, d,
+                                         x_max, x_min, rng)
+        chromo_co = multimodal.sharingfitness(np.concatenate((chromo_off, chromo_off)), d, 0.7, 1)
+        return multimodal.tournamentselect(chromo_co, n, d, 10, rng)
+    return generation
+
+
+@case('abc.onlooker_source', dims=False)
+def _(n, d, rng):
+    accuracy = rng.random(n)
+    return lambda: abc_search.onlooker_source(accuracy, rng)
+
+
+@case('abc.employed_stage', dims=False)
+def _(n, d, rng):
+    colony = [abc_search.random_candidate(rng) for i in range(n)]
+    return lambda: [abc_search.neighbour_candidate(colony, i, abc_search.pick_partner(i, n, rng=rng), rng) for i in range(n)]
+
+
+@case('abc.generation', dims=False, group='generation')
+def _(n, d, rng):
+    # Evaluation is free, so this is the bookkeeping of one ABC generation
+    evaluate = lambda candidate: candidate['LearningRate']
+    return lambda: abc_search.abc(evaluate, gy_size=n, gc_size=max(n // 2, 1), max_gen=1, seed=0)
+
+
+def bench_segmentation(batch_sizes=(32, 64), steps=10):
+    # Images/sec of the tf.data training pipeline and of a train step on CPU
+    results = []
+    try:
+        tf = importlib.import_module('tensorflow')
+        from bio_optimization import segmentation
+    except ImportError as e:
+        return [{'case': 'segmentation', 'status': 'skipped: %s' % e}]
+
+    with tf.device('/CPU:0'):
+        for batch_size in batch_sizes:
+            info, train_batches, validation_batches, test_batches = segmentation.load_batches(batch_size)
+            iterator = iter(train_batches)
+            next(iterator)
+            start = time.perf_counter()
+            for n in range(steps):
+                next(iterator)
+            seconds = time.perf_counter() - start
+            results.append({'case': 'segmentation.pipeline', 'n': batch_size, 'd': None, 'seconds': seconds / steps,
+                            'images_per_sec': batch_size * steps / seconds, 'status': 'ok'})
+
+            model = segmentation.build_unet_model('MP', 0.1)
+            model.compile(optimizer='adam', loss='sparse_categorical_crossentropy')
+            images, masks = next(iterator)
+            model.train_on_batch(images, masks)
+            start = time.perf_counter()
+            for n in range(steps):
+                model.train_on_batch(images, masks)
+            seconds = time.perf_counter() - start
+            results.append({'case': 'segmentation.train_step', 'n': batch_size, 'd': None, 'seconds': seconds / steps,
+                            'images_per_sec': batch_size * steps / seconds, 'status': 'ok'})
+    return results
+
+
+def bench_inference(model_path=None, modes=('float16', 'int8'), batch_sizes=(1, 8, 32), threads=(1, 2, 4),
+                    repeats=20, report_batches=4):
+    # p50/p99 latency of the Keras model and its TFLite conversions per batch size and thread count,
+    # and the accuracy each conversion loses on report_batches test batches. Without a saved model an
+    # untrained UNet is used, which times fine but makes the accuracy report meaningless
+    try:
+        tf = importlib.import_module('tensorflow')
+        from bio_optimization import inference, segmentation
+    except ImportError as e:
+        return [{'case': 'inference', 'status': 'skipped: %s' % e}]
+
+    if model_path:
+        model = tf.keras.models.load_model(model_path)
+    else:
+        model = segmentation.build_unet_model('MP', 0.1)
+    info, train_batches, validation_batches, test_batches = segmentation.load_batches(max(batch_sizes))
+    representative = [images for images, masks in train_batches.take(4).as_numpy_iterator()]
+    engines, flatbuffers = inference.quantized_engines(model, representative, modes)
+
+    results = []
+    report = inference.accuracy_report(engines, test_batches.take(report_batches).as_numpy_iterator())
+    print(inference.format_report(report), file=sys.stderr)
+    for name, r in report.items():
+        results.append(dict(r, case='inference.accuracy', model=name, status='report'))
+
+    rows = [dict(r, model='keras') for r in inference.benchmark(lambda t: engines['keras'], batch_sizes,
+                                                                  [tf.config.threading.get_intra_op_parallelism_threads()],
+                                                                  repeats)]
+    for mode, flatbuffer in flatbuffers.items():
+        rows.extend(dict(r, model=mode) for r in inference.benchmark(lambda t: inference.TFLiteModel(flatbuffer, num_threads=t),
+                                                                      batch_sizes, threads, repeats))
+    print(inference.format_benchmark(rows), file=sys.stderr)
+    for r in rows:
+        results.append(dict(r, case='inference.latency', n=r['batch_size'], d=r['threads'], seconds=r['p50'],
+                            status='ok'))
+    return results
+
+
+def timeit(fn, min_time=0.2, max_repeats=20):
+    # Best of several calls, at least one
+    times = []
+    total = 0.0
+    while not times or (total < min_time and len(times) < max_repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+        total = total + times[-1]
+    return min(times), len(times)
+
+
+def run_case(name, sizes, dims, max_seconds):
+    spec = CASES[name]
+    results = []
+    for d in (dims if spec['dims'] else [None]):
+        too_slow = False
+        for n in sizes:
+            row = {'case': name, 'group': spec['group'], 'n': n, 'd': d}
+            if too_slow or (spec['max_n'] is not None and n > spec['max_n']):
+                results.append(dict(row, status='skipped'))
+                continue
+            fn = spec['setup'](n, d if d is not None else 2, generator(0))
+            seconds, repeats = timeit(fn)
+            results.append(dict(row, seconds=seconds, repeats=repeats, status='ok'))
+            print('%-28s n=%-8d d=%-5s %.6f s' % (name, n, d, seconds), file=sys.stderr)
+            too_slow = seconds > max_seconds
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {'commit': commit, 'date': datetime.datetime.now().isoformat(), 'python': platform.python_version(),
+            'numpy': np.__version__, 'machine': platform.machine(), 'processor': platform.processor(),
+            'cpus': os.cpu_count()}
+
+
+def compare(old, new, threshold=1.1):
+    # Ratio new/old per case, size and dimension; slower than threshold is flagged
+    def key(r):
+        return r['case'], r.get('n'), r.get('d')
+    before = {key(r): r for r in old['results'] if r.get('status') == 'ok'}
+    for r in new['results']:
+        if r.get('status') != 'ok' or key(r) not in before:
+            continue
+        ratio = r['seconds'] / before[key(r)]['seconds']
+        flag = 'SLOWER' if ratio > threshold else ('faster' if ratio < 1 / threshold else '')
+        print('%-28s n=%-8s d=%-5s %8.3fx %s' % (r['case'], r['n'], r['d'], ratio, flag))
+
+
+def plot(data, output=None):
+    plt = importlib.import_module('matplotlib.pyplot')
+    cases = sorted({r['case'] for r in data['results'] if r.get('status') == 'ok'})
+    fig, axes = plt.subplots(len(cases), 1, figsize=(8, 3 * len(cases)))
+    for ax, name in zip(np.atleast_1d(axes), cases):
+        rows = [r for r in data['results'] if r['case'] == name and r.get('status') == 'ok']
+        for d in sorted({r['d'] for r in rows}, key=lambda d: -1 if d is None else d):
+            line = [r for r in rows if r['d'] == d]
+            ax.loglog([r['n'] for r in line], [r['seconds'] for r in line], marker='o', label='d=%s' % d)
+        ax.set_title(name)
+        ax.set_xlabel('population size')
+        ax.set_ylabel('seconds')
+        ax.legend()
+    fig.tight_layout()
+    if output:
+        fig.savefig(output)
+    else:
+        plt.show()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scaling benchmarks for the bio_optimization kernels')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('run')
+    p.add_argument('--cases', nargs='*', default=None, help='case names, default all')
+    p.add_argument('--sizes', nargs='*', type=int, default=SIZES)
+    p.add_argument('--dims', nargs='*', type=int, default=DIMS)
+    p.add_argument('--max-seconds', type=float, default=5.0, help='stop growing a case after a call this slow')
+    p.add_argument('--segmentation', action='store_true', help='also time the tf.data pipeline and train step')
+    p.add_argument('--output', default=None)
+
+    p = sub.add_parser('inference', help='CPU latency and quantization accuracy of the UNet')
+    p.add_argument('--model', default=None, help='saved Keras model, default an untrained UNet')
+    p.add_argument('--quantize', nargs='*', choices=['float32', 'float16', 'int8'], default=['float16', 'int8'])
+    p.add_argument('--batch-sizes', nargs='*', type=int, default=[1, 8, 32])
+    p.add_argument('--threads', nargs='*', type=int, default=[1, 2, 4])
+    p.add_argument('--repeats', type=int, default=20)
+    p.add_argument('--report-batches', type=int, default=4, help='test batches for the accuracy delta report')
+    p.add_argument('--output', default=None)
+
+    p = sub.add_parser('compare')
+    p.add_argument('old')
+    p.add_argument('new')
+    p.add_argument('--threshold', type=float, default=1.1)
+
+    p = sub.add_parser('plot')
+    p.add_argument('path')
+    p.add_argument('--output', default=None)
+
+    args = parser.parse_args(argv)
+    if args.command in ('run', 'inference'):
+        results = []
+        if args.command == 'inference':
+            results.extend(bench_inference(args.model, args.quantize, args.batch_sizes, args.threads, args.repeats,
+                                           args.report_batches))
+        else:
+            for name in args.cases or sorted(CASES):
+                results.extend(run_case(name, sorted(args.sizes), sorted(args.dims), args.max_seconds))
+            if args.segmentation:
+                results.extend(bench_segmentation())
+        text = json.dumps({'meta': metadata(), 'results': results}, indent=1)
+        if args.output:
+            os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+            with open(args.output, 'w') as f:
+                f.write(text)
+        else:
+            print(text)
+    elif args.command == 'compare':
+        with open(args.old) as f, open(args.new) as g:
+            compare(json.load(f), json.load(g), args.threshold)
+    else:
+        with open(args.path) as f:
+            plot(json.load(f), args.output)
+
+
+if __name__ == '__main__':
+    main()
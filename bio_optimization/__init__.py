@@ -0,0 +1,13 @@
+import importlib
+
+# Bio-inspired optimizers (GA, NSGA-II, multimodal niching, ABC) and the UNet hyperparameter search.
+# Submodules are imported on first attribute access and only segmentation touches TensorFlow,
+# so NumPy-only workers start without paying for it.
+
+__all__ = ['abc_search', 'cli', 'ga', 'inference', 'ledger', 'metrics', 'multimodal', 'niching', 'nsga2', 'pareto_search', 'profiling', 'rng', 'segmentation', 'trial_queue']
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
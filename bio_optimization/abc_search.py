@@ -0,0 +1,468 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from . import profiling
+from .ledger import trial_row
+from .rng import generator, seed_int, seed_sequence, stream
+
+# Hyperparameter search space of the UNet, same bounds as abc_and_segmentation.py, plus the
+# architecture. Every input size is a multiple of 2**depth for every depth
+dim = 9
+
+# The default abandonment limit, 0.2 * limit_dim * gy_size, counts the five training dimensions only,
+# so adding the architecture to the search doesn't hold back the scouts
+limit_dim = 5
+
+lr_min = 0.001
+lr_max = 0.1
+
+epochs_min = 1
+epochs_max = 11
+
+batchsize_data = [32,64,128,256]
+
+poolingtype = ['MP', 'AP']
+
+dr_min = 0.001
+dr_max = 0.1
+
+basefilters_data = [16,32,64]
+
+depth_data = [2,3,4]
+
+bottleneck_data = [32,64,128,256,512]
+
+inputsize_data = [64,96,128]
+
+# Architecture dimensions are ordinal, neighbour_candidate moves them along these lists
+architecture_data = {'BaseFilters': basefilters_data, 'Depth': depth_data,
+                     'BottleneckFilters': bottleneck_data, 'InputSize': inputsize_data}
+
+
+def random_candidate(rng=None):
+    # A food source is one set of hyperparameters, drawn from one block of uniforms.
+    # The notebook drew LearningRate, Epochs and DropoutRate from 0 rather than from their minimum,
+    # which could train for 0 epochs; here every value starts inside its bounds
+    u = generator(rng).random(dim)
+    candidate = {
+        'LearningRate': float(lr_min + (lr_max - lr_min) * u[0]),
+        'Epochs': int(epochs_min + round((epochs_max - epochs_min) * u[1])),
+        'DropoutRate': float(dr_min + (dr_max - dr_min) * u[2]),
+        'BatchSize': batchsize_data[int(u[3] * len(batchsize_data))],
+        'PoolingType': poolingtype[int(u[4] * len(poolingtype))],
+    }
+    for n, (key, values) in enumerate(architecture_data.items()):
+        candidate[key] = values[int(u[5 + n] * len(values))]
+    return candidate
+
+
+def neighbour_candidate(colony, i, k, rng=None, fai=None):
+    # Move food source i relative to food source k, the categorical dimensions are kept and the
+    # architecture moves by list position. The notebook re-drew BatchSize and PoolingType after an
+    # improvement, so the stored food source was not the one that had scored; here they are kept.
+    # Drivers pass fai pre-drawn for the whole stage
+    if fai is None:
+        fai = generator(rng).uniform(-1, 1)
+    source, other = colony[i], colony[k]
+
+    new_LearningRate = source['LearningRate'] + fai * (source['LearningRate'] - other['LearningRate'])
+    new_Epochs = round(source['Epochs'] + fai * (source['Epochs'] - other['Epochs']))
+    new_DropoutRate = source['DropoutRate'] + fai * (source['DropoutRate'] - other['DropoutRate'])
+
+    candidate = dict(source)
+    candidate['LearningRate'] = float(max(lr_min, min(lr_max, new_LearningRate)))
+    candidate['Epochs'] = int(max(epochs_min, min(epochs_max, new_Epochs)))
+    candidate['DropoutRate'] = float(max(dr_min, min(dr_max, new_DropoutRate)))
+    for key, values in architecture_data.items():
+        if key in source and key in other:#candidates from before the architecture search keep the default network
+            a, b = values.index(source[key]), values.index(other[key])
+            candidate[key] = values[int(max(0, min(len(values) - 1, round(a + fai * (a - b)))))]
+    return candidate
+
+
+def pick_partner(i, gy_size, ready=None, rng=None):
+    # Select a food source other than i
+    choices = [k for k in range(gy_size) if k != i and (ready is None or ready[k])]
+    return choices[generator(rng).integers(len(choices))] if choices else i
+
+
+def pick_partners(sources, gy_size, rng=None):
+    # pick_partner for a whole stage at once
+    sources = np.asarray(sources)
+    if gy_size < 2:
+        return sources.copy()
+    return (sources + 1 + generator(rng).integers(0, gy_size - 1, len(sources))) % gy_size
+
+
+def onlooker_source(accuracy, rng=None, size=None):
+    # Roulette wheel on the cumulative probability, better food sources are visited more often.
+    # The notebook weighted by exp(-accuracy/mean), which favours worse sources, and its loop over the
+    # wheel had no break, so every onlooker went to the last source. Here the weight is exp(+accuracy/mean)
+    # and the wheel is sampled.
+    # With a size, that many onlookers are placed from one block of uniforms
+    accuracy = np.asarray(accuracy, dtype=float)
+    meanvalue = np.mean(accuracy)
+    F = np.exp(accuracy / meanvalue) if meanvalue > 0 else np.ones(len(accuracy))
+    P = np.cumsum(F / np.sum(F))
+    picks = np.minimum(np.searchsorted(P, generator(rng).random(size)), len(P) - 1)
+    return int(picks) if size is None else picks
+
+
+def history_accuracy(model_history):
+    # Fitness of a trained model is the last training accuracy
+    if model_history.history:
+        return model_history.history['accuracy'][-1]
+    return 1
+
+
+def candidate_key(candidate):
+    # Identity of a candidate in the evaluation cache, the evaluation seed doesn't count
+    return tuple(sorted((k, v) for k, v in candidate.items() if k != 'Seed'))
+
+
+def measure(evaluate, candidate, cache=None):
+    # Every evaluation records accuracy, wall time, training steps/sec and the peak RSS sampled while it ran.
+    # evaluate returns the accuracy, or a dict with 'accuracy' and optionally 'steps'. Fields already
+    # measured elsewhere (e.g. by a trial_queue worker) are kept.
+    # With a cache dict a candidate evaluated before is not trained again, its earlier measurement
+    # comes back with 'cache_hit' set. Failed evaluations (with an 'error') are not cached.
+    if cache is not None:
+        key = candidate_key(candidate)
+        if key in cache:
+            return dict(cache[key], cache_hit=True)
+
+    with profiling.phase('evaluate'), profiling.RSSSampler() as rss:
+        start = time.perf_counter()
+        value = evaluate(candidate)
+        wall_time = time.perf_counter() - start
+        profiling.count()
+
+    measurement = dict(value) if isinstance(value, dict) else {'accuracy': value}
+    measurement.setdefault('wall_time', wall_time)
+    if 'steps' in measurement and 'steps_per_sec' not in measurement:
+        seconds = measurement.get('train_time', measurement['wall_time'])
+        measurement['steps_per_sec'] = measurement['steps'] / seconds if seconds > 0 else 0.0
+    measurement.setdefault('peak_rss', rss.peak)
+    if cache is not None and 'error' not in measurement:
+        cache[key] = measurement
+    return measurement
+
+
+def count_trained(measurements):
+    # Evaluations run on executor threads count towards the submitting thread's phase, cache hits don't
+    profiling.count(sum(not m.get('cache_hit') for m in measurements))
+
+
+def fitness_accuracy(measurement):
+    return measurement['accuracy']
+
+
+def fitness_mean_iou(measurement):
+    # Evaluators that don't report IoU are scored on accuracy
+    return measurement.get('mean_iou', measurement['accuracy'])
+
+
+def fitness_cost_penalized(penalty):
+    # Accuracy minus penalty per hour of training
+    def fitness(measurement):
+        return measurement['accuracy'] - penalty * measurement['wall_time'] / 3600
+    return fitness
+
+
+def fitness_accuracy_per_second(measurement):
+    return measurement['accuracy'] / max(measurement['wall_time'], 1e-9)
+
+
+def mean_cost(evaluations):
+    # Mean seconds of the evaluations that trained, cache hits cost nothing
+    costs = [m['wall_time'] for m in evaluations if not m.get('cache_hit')]
+    if not costs:
+        return 0.0
+    return float(np.mean(costs))
+
+
+def seeded(candidate, ss, *key):
+    # The candidate as handed to evaluate, with a Seed for the evaluator's own RNG (TensorFlow)
+    if ss is None:
+        return candidate
+    return dict(candidate, Seed=seed_int(ss, 'evaluation', *key))
+
+
+def subsampled(candidate, shards):
+    # The candidate as handed to evaluate, scored on the first shards validation shards
+    if shards is None:
+        return candidate
+    return dict(candidate, ValidationShards=shards)
+
+
+def finalists(colony, best):
+    # The food sources, and the best candidate if a scout has replaced it since
+    return list(colony) + ([best] if best is not None and best not in colony else [])
+
+
+def abc(evaluate, gy_size=5, gc_size=3, max_gen=5, limit=None, fitness=fitness_accuracy, budget=None,
+        seed=None, n_workers=1, executor=None, validation_shards=None, ledger=None, cache=None):
+    # Synchronous ABC: employed bees, then onlookers, then scouts, one generation at a time.
+    # With a budget in seconds, no generation is started that the mean evaluation time says won't
+    # finish in time on n_workers, and scouts are skipped when they would eat into the next generation.
+    # All bees of a stage are placed from the colony as it was when the stage started and their
+    # random numbers come from that stage's own stream, so the bees of a stage can be evaluated on
+    # n_workers in parallel and a seeded run gives the same result for any n_workers.
+    # With validation_shards the generations are scored on that many validation shards only, and
+    # the final food sources are ranked again on the whole split if the budget allows.
+    # Every evaluation is appended to ledger if one is given, see ledger.py; cache is passed to measure().
+    if limit is None:
+        limit = round(0.2 * limit_dim * gy_size)
+
+    start = time.perf_counter()
+    evaluations = []
+    ss = None if seed is None else seed_sequence(seed)
+    root = seed_sequence(ss)
+
+    own_executor = executor is None and n_workers > 1
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=n_workers)
+
+    def run(candidates, bees, phase, gen=None, shards=validation_shards):
+        # Fitness of every candidate, in order. bees are the food sources they belong to
+        key = (phase,) if gen is None else (phase, gen)
+        calls = [seeded(subsampled(candidate, shards), ss, *key, n) for n, candidate in enumerate(candidates)]
+        if executor is None:
+            results = [measure(evaluate, call, cache) for call in calls]
+        else:
+            results = list(executor.map(measure, [evaluate] * len(calls), calls, [cache] * len(calls)))
+            count_trained(results)
+        evaluations.extend(results)
+        new_fit = [fitness(m) for m in results]
+        if ledger is not None:
+            generation = 0 if gen is None else gen + 1
+            for bee, call, m, f in zip(bees, calls, results, new_fit):
+                ledger.append(trial_row(phase, generation if phase != 'rank' else len(record), int(bee), call, m, f))
+        return new_fit
+
+    def remaining():
+        return float('inf') if budget is None else budget - (time.perf_counter() - start)
+
+    def rounds(size):
+        # Evaluations one worker runs in a stage of size bees
+        return -(-size // n_workers)
+
+    def greedy(sources, candidates, new_fit):
+        for i, candidate, f in zip(sources, candidates, new_fit):
+            if f > fit[i]:
+                colony[i] = candidate
+                fit[i] = f
+            else:
+                L[i] = L[i] + 1
+
+    def stage(sources, rng, phase, gen):
+        sources = np.asarray(sources)
+        partners = pick_partners(sources, gy_size, rng)
+        fai = rng.uniform(-1, 1, len(sources))
+        candidates = [neighbour_candidate(colony, i, k, fai=f) for i, k, f in zip(sources, partners, fai)]
+        greedy(sources, candidates, run(candidates, sources, phase, gen))
+
+    record = []
+    try:
+        with profiling.phase('abc.init'):
+            rng = stream(root, 'init')
+            colony = [random_candidate(rng) for i in range(gy_size)]
+            fit = run(colony, range(gy_size), 'init')
+        L = np.zeros(gy_size)
+        idx_max = int(np.argmax(fit))
+        maxfit = fit[idx_max]
+        best = dict(colony[idx_max])
+
+        for gen in range(max_gen):
+            if remaining() < mean_cost(evaluations) * (rounds(gy_size) + rounds(gc_size)):
+                break
+
+            # Employed bee stage
+            with profiling.phase('abc.employed', generation=gen + 1):
+                stage(range(gy_size), stream(root, 'employed', gen), 'employed', gen)
+
+            # onlooker bee stage
+            with profiling.phase('abc.onlooker', generation=gen + 1):
+                rng = stream(root, 'onlooker', gen)
+                stage(onlooker_source(fit, rng, gc_size), rng, 'onlooker', gen)
+
+            # scout bees stage
+            with profiling.phase('abc.scout', generation=gen + 1):
+                exhausted = [i for i in range(gy_size) if L[i] >= limit]
+                cost = mean_cost(evaluations)
+                if exhausted and cost > 0 and budget is not None:
+                    exhausted = exhausted[:max(0, (int(remaining() / cost) - rounds(gy_size) - rounds(gc_size)) * n_workers)]
+                if exhausted:
+                    rng = stream(root, 'scout', gen)
+                    scouts = [random_candidate(rng) for i in exhausted]
+                    for i, candidate, f in zip(exhausted, scouts, run(scouts, exhausted, 'scout', gen)):
+                        colony[i] = candidate
+                        fit[i] = f
+                        L[i] = 0
+
+            # Completing a generation of updates
+            for i in range(gy_size):
+                if fit[i] > maxfit:
+                    best = dict(colony[i])
+                    maxfit = fit[i]
+                    idx_max = i
+            record.append([gen + 1, idx_max, maxfit])
+
+        # Final ranking on the whole validation split, the subsampled fitness is not comparable
+        ranking = None
+        if validation_shards is not None:
+            candidates = finalists(colony, best)
+            if remaining() >= mean_cost(evaluations) * rounds(len(candidates)):
+                with profiling.phase('abc.rank'):
+                    bees = list(range(gy_size)) + [-1] * (len(candidates) - gy_size)#-1 is the replaced best
+                    ranking = run(candidates, bees, 'rank', shards=None)
+                best = dict(candidates[int(np.argmax(ranking))])
+                maxfit = max(ranking)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    return {'colony': colony, 'fitness': fit, 'L': L, 'best': best, 'maxfit': maxfit, 'record': record,
+            'ranking': ranking, 'evaluations': evaluations, 'elapsed': time.perf_counter() - start}
+
+
+def abc_async(evaluate, n_workers=2, gy_size=5, gc_size=3, max_evals=None, limit=None, executor=None,
+              fitness=fitness_accuracy, budget=None, seed=None, validation_shards=None, ledger=None, cache=None):
+    # Steady-state ABC without generation barriers. Every time a worker frees up it gets the next bee:
+    # employed bees walk round-robin over the food sources, every gy_size employed bees are followed
+    # by gc_size onlookers, and exhausted food sources are sent to a scout first.
+    # Roles are chosen from the current, possibly stale, colony and results are applied greedily
+    # as they arrive. evaluate must be picklable if executor is a process pool.
+    # With a budget in seconds no bee is dispatched that the mean evaluation time says won't finish
+    # in time, and scouts are skipped once less than one cycle of bees per worker is left.
+    # Every dispatched bee draws from its own stream, keyed by its dispatch number. A seeded run is
+    # reproducible with one worker; with more, results arrive in timing order and change the colony
+    # the later bees see, so only the draws of each bee are fixed.
+    # validation_shards, ledger and cache work as in abc(), the ledger generation of a bee is the
+    # employed/onlooker cycle it was dispatched in.
+    if limit is None:
+        limit = round(0.2 * limit_dim * gy_size)
+    if max_evals is None:
+        max_evals = gy_size + 5 * (gy_size + gc_size)
+
+    ss = None if seed is None else seed_sequence(seed)
+    root = seed_sequence(ss)
+    rng = stream(root, 'init')
+    colony = [random_candidate(rng) for i in range(gy_size)]
+    fit = [None] * gy_size
+    ready = [False] * gy_size#The food source has been evaluated at least once
+    scouting = [False] * gy_size
+    L = np.zeros(gy_size)
+    turn = 0#Position in the employed/onlooker cycle
+    best, maxfit, idx_max = None, None, None
+    record = []
+    evaluations = []
+
+    start = time.perf_counter()
+
+    def remaining():
+        return float('inf') if budget is None else budget - (time.perf_counter() - start)
+
+    def next_bee(rng):
+        nonlocal turn
+        if remaining() >= mean_cost(evaluations) * (gy_size + gc_size) / n_workers:
+            for i in range(gy_size):
+                if ready[i] and not scouting[i] and L[i] >= limit:
+                    L[i] = 0
+                    scouting[i] = True
+                    colony[i] = random_candidate(rng)
+                    return 'scout', i, colony[i]
+
+        for attempt in range(gy_size + gc_size):
+            position = turn % (gy_size + gc_size)
+            turn = turn + 1
+            if position < gy_size:
+                i = position
+            else:
+                i = onlooker_source([fit[m] if ready[m] else 0.0 for m in range(gy_size)], rng)
+            if ready[i] and not scouting[i]:
+                role = 'employed' if position < gy_size else 'onlooker'
+                return role, i, neighbour_candidate(colony, i, pick_partner(i, gy_size, ready, rng), rng)
+        return None
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=n_workers)
+
+    inflight = {}
+    submitted = 0
+    pending = [('init', i, colony[i]) for i in range(gy_size)]
+    try:
+        while True:
+            # Keep every worker busy
+            while len(inflight) < n_workers and submitted < max_evals:
+                if not pending and remaining() < mean_cost(evaluations):
+                    break
+                with profiling.phase('abc_async.dispatch'):
+                    bee = pending.pop(0) if pending else next_bee(stream(root, 'bee', submitted))
+                if bee is None:
+                    break
+                call = seeded(subsampled(bee[2], validation_shards), ss, submitted)
+                cycle = 0 if bee[0] == 'init' else turn // (gy_size + gc_size) + 1
+                inflight[executor.submit(measure, evaluate, call, cache)] = bee + (call, cycle)
+                submitted = submitted + 1
+
+            if not inflight:
+                break
+
+            with profiling.phase('abc_async.wait'):
+                done, not_done = wait(list(inflight), return_when=FIRST_COMPLETED)
+                count_trained([future.result() for future in done if future.exception() is None])
+            for future in done:
+                role, i, candidate, call, cycle = inflight.pop(future)
+                evaluations.append(future.result())
+                new_fit = fitness(evaluations[-1])
+                if ledger is not None:
+                    ledger.append(trial_row(role, cycle, i, call, evaluations[-1], new_fit))
+
+                if role in ('init', 'scout'):
+                    colony[i] = candidate
+                    fit[i] = new_fit
+                    ready[i] = True
+                    scouting[i] = False
+                elif new_fit > fit[i]:
+                    colony[i] = candidate
+                    fit[i] = new_fit
+                else:
+                    L[i] = L[i] + 1
+
+                if maxfit is None or new_fit > maxfit:
+                    best = dict(candidate)
+                    maxfit = new_fit
+                    idx_max = i
+                record.append([len(record) + 1, role, idx_max, maxfit])
+
+        ranking = None
+        if validation_shards is not None and best is not None:
+            bees = [i for i in range(gy_size) if ready[i]]
+            candidates = finalists([colony[i] for i in bees], best)
+            bees = bees + [-1] * (len(candidates) - len(bees))
+            if remaining() >= mean_cost(evaluations) * -(-len(candidates) // n_workers):
+                with profiling.phase('abc_async.rank'):
+                    calls = [seeded(c, ss, 'rank', n) for n, c in enumerate(candidates)]
+                    measurements = list(executor.map(measure, [evaluate] * len(calls), calls, [cache] * len(calls)))
+                    count_trained(measurements)
+                evaluations.extend(measurements)
+                ranking = [fitness(m) for m in measurements]
+                if ledger is not None:
+                    cycle = turn // (gy_size + gc_size)
+                    for bee, call, m, f in zip(bees, calls, measurements, ranking):
+                        ledger.append(trial_row('rank', cycle, bee, call, m, f))
+                best = dict(candidates[int(np.argmax(ranking))])
+                maxfit = max(ranking)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    elapsed = time.perf_counter() - start
+    busy_time = sum(m['wall_time'] for m in evaluations if not m.get('cache_hit'))
+    utilization = busy_time / (elapsed * n_workers) if elapsed > 0 else 1.0
+    return {'colony': colony, 'fitness': fit, 'L': L, 'best': best, 'maxfit': maxfit, 'record': record,
+            'ranking': ranking, 'evaluations': evaluations, 'elapsed': elapsed, 'utilization': utilization}
@@ -0,0 +1,127 @@
+import argparse
+import json
+import sys
+
+from . import abc_search, ledger, pareto_search, profiling, trial_queue
+
+# bio-opt search   run an ABC search (sync, async or multi-objective) with a local or queued evaluator
+# bio-opt worker   claim and evaluate trials from a trial queue
+# bio-opt status   count the trials of a trial queue by status
+
+DEFAULT_EVALUATE = 'bio_optimization.segmentation:evaluate'
+
+
+def make_fitness(args):
+    if args.fitness in (None, 'accuracy'):
+        return abc_search.fitness_accuracy
+    if args.fitness == 'per-second':
+        return abc_search.fitness_accuracy_per_second
+    if args.fitness == 'iou':
+        return abc_search.fitness_mean_iou
+    return abc_search.fitness_cost_penalized(args.penalty)
+
+
+def search(args):
+    if args.queue:
+        evaluate = trial_queue.remote_evaluator(args.queue, poll=args.poll)
+    else:
+        evaluate = trial_queue.load_callable(args.evaluate)
+
+    trials = ledger.Ledger(args.ledger) if args.ledger else None
+    cache = {} if args.cache else None
+    try:
+        if args.mode == 'sync':
+            result = abc_search.abc(evaluate, gy_size=args.gy_size, gc_size=args.gc_size, max_gen=args.max_gen,
+                                    fitness=make_fitness(args), budget=args.budget, seed=args.seed,
+                                    n_workers=args.workers, validation_shards=args.validation_shards,
+                                    ledger=trials, cache=cache)
+        elif args.mode == 'async':
+            result = abc_search.abc_async(evaluate, n_workers=args.workers, gy_size=args.gy_size, gc_size=args.gc_size,
+                                          max_evals=args.max_evals, fitness=make_fitness(args), budget=args.budget,
+                                          seed=args.seed, validation_shards=args.validation_shards,
+                                          ledger=trials, cache=cache)
+        else:
+            result = pareto_search.pareto_abc(evaluate, N=args.gy_size, max_gen=args.max_gen, n_workers=args.workers,
+                                              seed=args.seed, ledger=trials, cache=cache, budget=args.budget,
+                                              max_evals=args.max_evals)
+            result['cheapest'] = pareto_search.cheapest_within(result['trials'], tol=args.tol, cost=args.cost)
+    finally:
+        if trials is not None:
+            trials.close()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='bio-opt', description='Bio-inspired hyperparameter search for the UNet')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('search', help='run an ABC hyperparameter search')
+    p.add_argument('--mode', choices=['sync', 'async', 'pareto'], default='sync')
+    p.add_argument('--evaluate', default=DEFAULT_EVALUATE, help='module:function taking a candidate dict')
+    p.add_argument('--queue', help='publish candidates to this trial queue instead of evaluating locally')
+    p.add_argument('--poll', type=float, default=1.0)
+    p.add_argument('--gy-size', type=int, default=5)
+    p.add_argument('--gc-size', type=int, default=3)
+    p.add_argument('--max-gen', type=int, default=5)
+    p.add_argument('--max-evals', type=int, default=None)
+    p.add_argument('--workers', type=int, default=1)
+    p.add_argument('--fitness', choices=['accuracy', 'iou', 'per-second', 'penalized'], default=None,
+                   help='single-objective modes, default accuracy')
+    p.add_argument('--penalty', type=float, default=0.01, help='accuracy lost per hour of training')
+    p.add_argument('--budget', type=float, default=None, help='wall-clock budget in seconds')
+    p.add_argument('--validation-shards', type=int, default=None,
+                   help='score the search on this many of the 10 validation shards, rank the final colony on all')
+    p.add_argument('--ledger', help='append every evaluation to this trial ledger directory')
+    p.add_argument('--cache', action='store_true', help='evaluate a repeated candidate only once')
+    p.add_argument('--tol', type=float, default=0.01, help='pareto mode: accuracy tolerance of the cheapest pick')
+    p.add_argument('--cost', choices=['latency', 'train_time', 'wall_time', 'flops', 'params'], default='latency',
+                   help='pareto mode: cost minimized by the cheapest pick')
+    p.add_argument('--seed', type=int, default=None, help='master seed of all random streams')
+    p.add_argument('--output', help='write the result as JSON to this file')
+    p.add_argument('--profile', action='store_true', help='print time spent per phase to stderr')
+    p.add_argument('--trace', help='write a Chrome trace (Perfetto) of the phases to this file')
+    p.add_argument('--phase-log', help='write one JSON line per phase to this file')
+
+    p = sub.add_parser('worker', help='claim and evaluate trials from a trial queue')
+    p.add_argument('path')
+    p.add_argument('--evaluate', default=DEFAULT_EVALUATE, help='module:function taking a candidate dict')
+    p.add_argument('--lease', type=float, default=600, help='seconds a claimed trial is held without a heartbeat')
+    p.add_argument('--poll', type=float, default=1.0)
+    p.add_argument('--max-trials', type=int, default=None)
+    p.add_argument('--max-attempts', type=int, default=3, help='tries of a trial before it is marked failed')
+
+    p = sub.add_parser('status', help='count the trials of a trial queue by status')
+    p.add_argument('path')
+
+    args = parser.parse_args(argv)
+    if args.command == 'search' and args.mode == 'pareto':
+        # Pareto mode optimizes accuracy, training time and latency together on the whole validation split
+        for option, value in (('--fitness', args.fitness), ('--validation-shards', args.validation_shards)):
+            if value is not None:
+                parser.error('%s does not apply to --mode pareto' % option)
+    if args.command == 'search':
+        sinks = [profiling.SummarySink()] if args.profile else []
+        if args.trace:
+            sinks.append(profiling.ChromeTraceSink(args.trace))
+        if args.phase_log:
+            sinks.append(profiling.JsonLinesSink(args.phase_log))
+        with profiling.profile(*sinks):
+            result = search(args)
+        if args.profile:
+            sys.stderr.write(profiling.format_summary(sinks[0].summary()) + '\n')
+        text = json.dumps(result, indent=1, default=lambda o: o.tolist() if hasattr(o, 'tolist') else str(o))
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(text)
+        else:
+            sys.stdout.write(text + '\n')
+    elif args.command == 'worker':
+        trial_queue.worker(args.path, trial_queue.load_callable(args.evaluate), lease=args.lease, poll=args.poll,
+                           max_trials=args.max_trials, max_attempts=args.max_attempts)
+    else:
+        for status, count in trial_queue.status(args.path).items():
+            print(status, count)
+
+
+if __name__ == '__main__':
+    main()
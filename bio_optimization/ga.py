@@ -0,0 +1,79 @@
+import numpy as np
+
+from .profiling import profiled
+from .rng import generator
+
+# Binary-coded genetic algorithm from Genetic Algorithm.ipynb, maximizing f(x) = x sin(10 pi x) + 1 on [-0.5, 1]
+
+def fx(x):
+    fx = x * np.sin(10 * np.pi * x) + 1
+    return fx
+
+
+def oringinalPopulation(num, xmin = -0.5, xmax = 1, rng = None):
+    oringinalPopulation = generator(rng).uniform(xmin, xmax, num)
+    return oringinalPopulation
+
+
+def GAEncode(population, xmin = -0.5, xmax = 1, scale = 2**18, encodelength = 18):
+    normalized = (population - xmin) / (xmax - xmin) * scale
+    encode = [np.binary_repr(x, width = encodelength) for x in normalized.astype(int)]
+    return np.array(encode)
+
+
+def GADecode(populationcode, xmin = -0.5, xmax = 1, scale = 2**18):
+    decode = np.array([int(x, base = 2) for x in populationcode]) / scale * (xmax - xmin) + xmin
+    return np.round(decode, 4)
+
+
+@profiled('ga.GASelect')
+def GASelect(parents, fitness, prob=0.6, rng=None):
+    # Roulette wheel selection
+    probs = fitness/np.sum(fitness)
+    cumsumprobs = np.cumsum(probs)
+    uniformrand = generator(rng).random(len(fitness))
+    select = parents[np.minimum(np.searchsorted(cumsumprobs, uniformrand, side='right'), len(parents) - 1)]
+    return np.array(select)
+
+
+@profiled('ga.GACrossover')
+def GACrossover(parents, prob=0.6, rng=None):
+    # Single point crossover of a random prob share of the population
+    crossparents = generator(rng).permutation(int(len(parents)*prob//2*2)).reshape(-1, 2)
+    crosspoint = len(parents[0])//2
+    parents = parents.copy()
+    for i, j in crossparents:
+        x, y = parents[i], parents[j]
+        parents[i] = x[:crosspoint] + y[crosspoint:]
+        parents[j] = y[:crosspoint] + x[crosspoint:]
+    return parents
+
+
+@profiled('ga.GAMutate')
+def GAMutate(parents, prob = 0.1, rng = None):
+    # Flip one random bit of each chromosome with probability prob
+    rng = generator(rng)
+    chromslength = len(parents[0])
+    m = {'0':'1', '1':'0'}
+    newgeneration = []
+    each_prob = rng.random(len(parents))
+    positions = rng.integers(chromslength, size=len(parents))
+    for i, chrom in enumerate(parents):
+        if each_prob[i] < prob:
+            prochroms = positions[i]
+            chrom = chrom[:prochroms] + m[chrom[prochroms]] + chrom[prochroms+1:]
+        newgeneration.append(chrom)
+    return np.array(newgeneration)
+
+
+def runGA(num=100, generations=1000, crossover=True, seed=0):
+    # Returns the best, worst and average fitness of every generation and the last population
+    rng = generator(seed)
+    parents = GAEncode(oringinalPopulation(num, rng=rng))
+    record = []
+    for i in range(generations):
+        fitness = fx(GADecode(parents))
+        record.append([i, np.max(fitness), np.min(fitness), np.average(fitness)])
+        selected = GASelect(parents, fitness, rng=rng)
+        parents = GAMutate(GACrossover(selected, rng=rng) if crossover else selected, rng=rng)
+    return np.array(record), GADecode(parents)
@@ -0,0 +1,289 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from . import profiling
+from .metrics import SegmentationMetrics
+from .rng import generator
+from .segmentation import _tf
+
+# CPU inference for the UNet selected by the search.
+#
+#   predict = TFLiteModel(quantize(model, 'int8', representative), num_threads=4)
+#   with MicroBatcher(predict, max_batch=32) as batcher:
+#       probs = predict_tiled(batcher.map, large_image)
+#
+# A predictor is any function from a float32 batch (n, 128, 128, 3) to class probabilities
+# (n, 128, 128, classes): keras_predictor() of a Keras model or a TFLiteModel. MicroBatcher collects
+# single images from many threads into batches, predict_tiled() covers larger images with
+# overlapping 128x128 tiles. quantize() converts the model to TFLite float16 or int8,
+# accuracy_report() gives the accuracy lost by quantization and benchmark() the p50/p99 latency
+# per batch size and thread count.
+
+TILE = 128
+
+
+def keras_predictor(model):
+    # Keras models run on the TensorFlow thread pools configured at startup
+    def predict(batch):
+        return np.asarray(model.predict_on_batch(np.asarray(batch, dtype=np.float32)))
+    return predict
+
+
+def quantize(model, mode='float16', representative=None):
+    # TFLite flatbuffer of model. 'float16' stores the weights in half precision, 'int8' quantizes
+    # weights and activations with ranges calibrated on representative, an iterable of input batches.
+    # Inputs and outputs stay float32 in every mode
+    tf = _tf()
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if mode == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif mode == 'int8':
+        if representative is None:
+            raise ValueError('int8 quantization needs representative input batches')
+
+        def representative_dataset():
+            for batch in representative:
+                for image in np.asarray(batch, dtype=np.float32):
+                    yield [image[None]]
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif mode != 'float32':
+        raise ValueError('unknown quantization mode %r' % mode)
+    with profiling.phase('inference.quantize', mode=mode):
+        return converter.convert()
+
+
+class TFLiteModel:
+    # Predictor running a TFLite flatbuffer on num_threads. The input is resized when the batch size
+    # changes, so callers should keep to a few batch sizes (MicroBatcher pads to powers of two)
+    def __init__(self, flatbuffer, num_threads=None):
+        tf = _tf()
+        self.interpreter = tf.lite.Interpreter(model_content=flatbuffer, num_threads=num_threads)
+        self.input = self.interpreter.get_input_details()[0]['index']
+        self.output = self.interpreter.get_output_details()[0]['index']
+        self.shape = None
+        self.lock = threading.Lock()
+
+    def __call__(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        with self.lock:
+            if batch.shape != self.shape:
+                self.interpreter.resize_tensor_input(self.input, batch.shape)
+                self.interpreter.allocate_tensors()
+                self.shape = batch.shape
+            self.interpreter.set_tensor(self.input, batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output).copy()
+
+
+def load_predictor(path, num_threads=None):
+    # A .tflite file or a saved Keras model
+    if str(path).endswith('.tflite'):
+        with open(path, 'rb') as f:
+            return TFLiteModel(f.read(), num_threads=num_threads)
+    return keras_predictor(_tf().keras.models.load_model(path))
+
+
+def quantized_engines(model, representative, modes=('float16', 'int8'), num_threads=None):
+    # Predictors of model as Keras, under 'keras', and as TFLite in every mode, and the TFLite
+    # flatbuffers. A 'float32' mode is the unquantized TFLite model, next to the Keras reference
+    representative = list(representative)
+    flatbuffers = {mode: quantize(model, mode, representative) for mode in modes}
+    engines = {'keras': keras_predictor(model)}
+    engines.update({mode: TFLiteModel(flatbuffer, num_threads=num_threads) for mode, flatbuffer in flatbuffers.items()})
+    return engines, flatbuffers
+
+
+def bucket(n, max_batch):
+    # Smallest power of two holding n images, at most max_batch
+    return min(1 << (n - 1).bit_length(), max_batch)
+
+
+class MicroBatcher:
+    # Dynamic micro-batching. submit() takes one image from any thread and returns a Future of its
+    # probabilities; a worker thread runs the queued images through predict in batches of up to
+    # max_batch, waiting at most max_delay seconds for a batch to fill. Partial batches are zero
+    # padded to a power of two so the predictor sees only a few batch shapes.
+    def __init__(self, predict, max_batch=32, max_delay=0.005, pad=True):
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.pad = pad
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.images = 0
+        self.thread = threading.Thread(target=self._run, name='MicroBatcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, image):
+        future = Future()
+        self.queue.put((np.asarray(image, dtype=np.float32), future))
+        return future
+
+    def map(self, images):
+        # Probabilities of a batch of images, shared with whatever else is queued
+        futures = [self.submit(image) for image in images]
+        return np.stack([future.result() for future in futures])
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self.queue.get()
+            if item is None:
+                break
+            items = [item]
+            deadline = time.perf_counter() + self.max_delay
+            while len(items) < self.max_batch:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                items.append(item)
+            self._predict(items)
+
+    def _predict(self, items):
+        n = len(items)
+        size = bucket(n, self.max_batch) if self.pad else n
+        batch = np.zeros((size,) + items[0][0].shape, dtype=np.float32)
+        for i, (image, future) in enumerate(items):
+            batch[i] = image
+        try:
+            with profiling.phase('inference.batch', images=n, batch_size=size):
+                probs = self.predict(batch)
+        except BaseException as e:
+            for image, future in items:
+                future.set_exception(e)
+            return
+        self.batches = self.batches + 1
+        self.images = self.images + n
+        for i, (image, future) in enumerate(items):
+            future.set_result(probs[i])
+
+    def close(self):
+        # Finishes the queued images
+        self.queue.put(None)
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def tile_starts(length, tile, stride):
+    if length <= tile:
+        return [0]
+    return list(range(0, length - tile, stride)) + [length - tile]
+
+
+def tile_weight(tile, overlap):
+    # Blending weights, falling off linearly over the overlap so tile seams don't show
+    ramp = np.ones(tile, dtype=np.float32)
+    if overlap > 0:
+        ramp[:overlap] = (np.arange(overlap) + 1) / (overlap + 1)
+        ramp[tile - overlap:] = ramp[:overlap][::-1]
+    return np.outer(ramp, ramp)[:, :, None]
+
+
+def predict_tiled(predict, image, tile=TILE, overlap=16, batch_size=32):
+    # Class probabilities of an (h, w, 3) image of any size from overlapping tile x tile windows.
+    # Images smaller than a tile are edge padded. Pass a MicroBatcher's map as predict to share
+    # batches between the tiles of several images
+    image = np.asarray(image, dtype=np.float32)
+    h, w = image.shape[:2]
+    H, W = max(h, tile), max(w, tile)
+    if (H, W) != (h, w):
+        image = np.pad(image, ((0, H - h), (0, W - w), (0, 0)), mode='edge')
+
+    stride = tile - overlap
+    windows = [(y, x) for y in tile_starts(H, tile, stride) for x in tile_starts(W, tile, stride)]
+    weight = tile_weight(tile, overlap)
+    out = None
+    norm = np.zeros((H, W, 1), dtype=np.float32)
+    with profiling.phase('inference.tiled', tiles=len(windows)):
+        for start in range(0, len(windows), batch_size):
+            chunk = windows[start:start + batch_size]
+            probs = predict(np.stack([image[y:y + tile, x:x + tile] for y, x in chunk]))
+            if out is None:
+                out = np.zeros((H, W, probs.shape[-1]), dtype=np.float32)
+            for (y, x), p in zip(chunk, probs):
+                out[y:y + tile, x:x + tile] += p * weight
+                norm[y:y + tile, x:x + tile] += weight
+    return (out / norm)[:h, :w]
+
+
+def accuracy_report(predictors, batches, reference='keras'):
+    # Pixel accuracy and mean IoU of every predictor over (images, masks) batches, their change
+    # against the reference predictor and the share of pixels on which they agree with it
+    names = list(predictors)
+    scores = {}
+    agree = dict.fromkeys(names, 0)
+    pixels = 0
+    for images, masks in batches:
+        images = np.asarray(images, dtype=np.float32)
+        preds = {}
+        for name in names:
+            probs = np.asarray(predictors[name](images))[:len(images)]
+            preds[name] = probs.argmax(-1)
+            scores.setdefault(name, SegmentationMetrics(probs.shape[-1])).update(masks, preds[name])
+        for name in names:
+            agree[name] += int(np.sum(preds[name] == preds[reference]))
+        pixels += preds[reference].size
+
+    report = {}
+    for name in names:
+        result = scores[name].result()
+        report[name] = {'pixel_accuracy': result['pixel_accuracy'], 'mean_iou': result['mean_iou'],
+                        'agreement': agree[name] / max(pixels, 1)}
+    for name in names:
+        report[name]['accuracy_delta'] = report[name]['pixel_accuracy'] - report[reference]['pixel_accuracy']
+        report[name]['iou_delta'] = report[name]['mean_iou'] - report[reference]['mean_iou']
+    return report
+
+
+def format_report(report):
+    lines = ['%-10s %10s %10s %10s %10s %10s' % ('model', 'pixel acc', 'delta', 'mean IoU', 'delta', 'agreement')]
+    for name, r in report.items():
+        lines.append('%-10s %10.4f %+10.4f %10.4f %+10.4f %10.4f' % (name, r['pixel_accuracy'], r['accuracy_delta'],
+                                                                     r['mean_iou'], r['iou_delta'], r['agreement']))
+    return '\n'.join(lines)
+
+
+def benchmark(make_predict, batch_sizes=(1, 8, 32), threads=(1, 2, 4), repeats=20, size=TILE, seed=0):
+    # Latency percentiles (seconds per batch) and throughput of make_predict(num_threads) for every
+    # batch size and thread count, after one warm-up call per shape
+    rng = generator(seed)
+    rows = []
+    for num_threads in threads:
+        predict = make_predict(num_threads)
+        for batch_size in batch_sizes:
+            batch = rng.random((batch_size, size, size, 3), dtype=np.float32)
+            predict(batch)
+            times = np.zeros(repeats)
+            for n in range(repeats):
+                start = time.perf_counter()
+                predict(batch)
+                times[n] = time.perf_counter() - start
+            rows.append({'threads': num_threads, 'batch_size': batch_size, 'p50': float(np.percentile(times, 50)),
+                         'p99': float(np.percentile(times, 99)), 'mean': float(times.mean()),
+                         'images_per_sec': batch_size / float(times.mean())})
+    return rows
+
+
+def format_benchmark(rows):
+    lines = ['%-10s %8s %8s %10s %10s %12s' % ('model', 'threads', 'batch', 'p50 ms', 'p99 ms', 'images/s')]
+    for r in rows:
+        lines.append('%-10s %8d %8d %10.2f %10.2f %12.1f' % (r.get('model', ''), r['threads'], r['batch_size'],
+                                                              r['p50'] * 1e3, r['p99'] * 1e3, r['images_per_sec']))
+    return '\n'.join(lines)
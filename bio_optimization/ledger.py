@@ -0,0 +1,231 @@
+import json
+import os
+import time
+
+import numpy as np
+
+# Append-only columnar trial ledger, one row per evaluation.
+#
+#   with Ledger('search.ledger') as ledger:
+#       abc(evaluate, ledger=ledger)
+#   trials = read_ledger('search.ledger')
+#   trials['accuracy'][trials.codes('phase') == trials.category('phase', 'onlooker')].max()
+#
+# A ledger is a directory with one raw little-endian file per column and schema.json. Rows are
+# buffered and appended to every column file every chunk rows, so each value is written exactly
+# once; schema.json is only rewritten when a column or a category is added. Readers memory-map the
+# column files, reading a column of a million trials doesn't touch the others. Strings are
+# dictionary encoded (int32 codes, -1 for missing), missing numbers are NaN for floats and -1 for
+# integers and booleans (stored as int8). A column first seen after n rows is back-filled with n
+# missing values once. A crash can only lose the buffered rows; a torn append is cut back to the
+# shortest column on open, and a column file the schema doesn't list yet is rewritten when the
+# column is added again.
+
+SCHEMA = 'schema.json'
+
+# Columns every ABC ledger starts with, hyperparameter columns follow the candidates
+COLUMNS = [('timestamp', 'f8'), ('generation', 'i4'), ('phase', 'category'), ('bee', 'i4'), ('accuracy', 'f8'),
+           ('fitness', 'f8'), ('wall_time', 'f8'), ('cache_hit', 'i1')]
+
+
+def missing(dtype):
+    if dtype == 'category':
+        return -1
+    return np.nan if np.dtype(dtype).kind == 'f' else -1
+
+
+def storage(dtype):
+    return np.dtype('<i4') if dtype == 'category' else np.dtype(dtype).newbyteorder('<')
+
+
+def infer_dtype(value):
+    if isinstance(value, (bool, np.bool_)):
+        return 'i1'
+    if isinstance(value, (int, np.integer)):
+        return 'i8'
+    if isinstance(value, (float, np.floating)):
+        return 'f8'
+    if isinstance(value, str):
+        return 'category'
+    return None#lists and other values are not stored
+
+
+def _write_schema(path, schema):
+    tmp = os.path.join(path, SCHEMA + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(schema, f, indent=1)
+    os.replace(tmp, os.path.join(path, SCHEMA))
+
+
+def _read_schema(path):
+    with open(os.path.join(path, SCHEMA)) as f:
+        return json.load(f)
+
+
+def _rows_on_disk(path, schema):
+    sizes = [os.path.getsize(os.path.join(path, c['name'] + '.bin')) // storage(c['dtype']).itemsize
+             for c in schema['columns'] if os.path.exists(os.path.join(path, c['name'] + '.bin'))]
+    return min(sizes) if sizes else 0
+
+
+class Ledger:
+    # Writer, appends to an existing ledger at path or creates it
+    def __init__(self, path, columns=COLUMNS, chunk=1024):
+        self.path = path
+        self.chunk = chunk
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, SCHEMA)):
+            self.schema = _read_schema(path)
+            self.rows = _rows_on_disk(path, self.schema)
+            for c in self.schema['columns']:
+                with open(os.path.join(path, c['name'] + '.bin'), 'ab') as f:
+                    f.truncate(self.rows * storage(c['dtype']).itemsize)
+        else:
+            self.schema = {'version': 1, 'columns': []}
+            self.rows = 0
+        self.index = {c['name']: c for c in self.schema['columns']}
+        self.lookup = {c['name']: {v: n for n, v in enumerate(c['categories'])}
+                       for c in self.schema['columns'] if c['dtype'] == 'category'}
+        self.buffer = []
+        self.dirty = False
+        for name, dtype in columns:
+            self.add_column(name, dtype)
+        self.flush_schema()
+
+    def add_column(self, name, dtype):
+        if name in self.index:
+            return self.index[name]
+        column = {'name': name, 'dtype': dtype}
+        if dtype == 'category':
+            column['categories'] = []
+            self.lookup[name] = {}
+        # A file without a schema entry is left over from a crash before the schema was written
+        with open(os.path.join(self.path, name + '.bin'), 'wb') as f:
+            f.write(np.full(self.rows, missing(dtype), dtype=storage(dtype)).tobytes())
+        self.schema['columns'].append(column)
+        self.index[name] = column
+        self.dirty = True
+        return column
+
+    def encode(self, name, value):
+        codes = self.lookup[name]
+        if value not in codes:
+            codes[value] = len(codes)
+            self.index[name]['categories'].append(value)
+            self.dirty = True
+        return codes[value]
+
+    def append(self, row):
+        # row maps column names to scalars, unknown names become new columns
+        encoded = {}
+        for name, value in row.items():
+            if value is None:
+                continue
+            column = self.index.get(name)
+            if column is None:
+                dtype = infer_dtype(value)
+                if dtype is None:
+                    continue
+                self.flush()
+                column = self.add_column(name, dtype)
+            elif infer_dtype(value) is None or (column['dtype'] != 'category' and isinstance(value, str)):
+                continue
+            encoded[name] = self.encode(name, str(value)) if column['dtype'] == 'category' else value
+        self.buffer.append(encoded)
+        if len(self.buffer) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        self.flush_schema()
+        if not self.buffer:
+            return
+        for column in self.schema['columns']:
+            name, dtype = column['name'], column['dtype']
+            values = np.array([row.get(name, missing(dtype)) for row in self.buffer], dtype=storage(dtype))
+            with open(os.path.join(self.path, name + '.bin'), 'ab') as f:
+                f.write(values.tobytes())
+        self.rows = self.rows + len(self.buffer)
+        self.buffer = []
+
+    def flush_schema(self):
+        # Categories have to be on disk before the codes that use them
+        if self.dirty:
+            _write_schema(self.path, self.schema)
+            self.dirty = False
+
+    def __len__(self):
+        return self.rows + len(self.buffer)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class LedgerReader:
+    # Memory-mapped view of the flushed rows of a ledger
+    def __init__(self, path):
+        self.path = path
+        self.schema = _read_schema(path)
+        self.rows = _rows_on_disk(path, self.schema)
+        self.index = {c['name']: c for c in self.schema['columns']}
+        self.maps = {}
+
+    @property
+    def columns(self):
+        return list(self.index)
+
+    def __len__(self):
+        return self.rows
+
+    def codes(self, name):
+        # Raw column: numbers as stored, categories as int32 codes
+        if name not in self.maps:
+            column = self.index[name]
+            if self.rows == 0:
+                self.maps[name] = np.zeros(0, dtype=storage(column['dtype']))
+            else:
+                self.maps[name] = np.memmap(os.path.join(self.path, name + '.bin'), dtype=storage(column['dtype']),
+                                            mode='r', shape=(self.rows,))
+        return self.maps[name]
+
+    def category(self, name, value):
+        # Code of a category value, -2 if it never occurs
+        categories = self.index[name]['categories']
+        return categories.index(value) if value in categories else -2
+
+    def __getitem__(self, name):
+        # Numbers as a memory map, categories decoded to an object array
+        column = self.index[name]
+        codes = self.codes(name)
+        if column['dtype'] != 'category':
+            return codes
+        categories = np.array(column['categories'] + [None], dtype=object)
+        return categories[codes]
+
+    def row(self, n):
+        row = {}
+        for name in self.columns:
+            value = self.codes(name)[n].item()
+            if self.index[name]['dtype'] == 'category':
+                value = self.index[name]['categories'][value] if value >= 0 else None
+            row[name] = value
+        return row
+
+
+def read_ledger(path):
+    return LedgerReader(path)
+
+
+def trial_row(phase, generation, bee, candidate, measurement, fitness):
+    # Ledger row of one evaluation: the candidate as evaluated and every scalar it measured
+    row = {'timestamp': time.time(), 'generation': generation, 'phase': phase, 'bee': bee,
+           'fitness': fitness, 'cache_hit': bool(measurement.get('cache_hit', False))}
+    row.update(candidate)
+    row.update((k, v) for k, v in measurement.items() if k != 'candidate')
+    return row
@@ -0,0 +1,32 @@
+import numpy as np
+
+# Streaming segmentation metrics. Predictions are scored batch by batch into one confusion matrix,
+# so memory stays at classes^2 counts however many images are scored.
+
+class SegmentationMetrics:
+    def __init__(self, classes):
+        self.classes = classes
+        self.confusion = np.zeros((classes, classes), dtype=np.int64)#rows true class, columns predicted
+
+    def update(self, masks, preds):
+        # masks and preds are class indices of the same number of pixels, in any shape
+        masks = np.asarray(masks).astype(np.int64).ravel()
+        preds = np.asarray(preds).astype(np.int64).ravel()
+        self.confusion += np.bincount(masks * self.classes + preds,
+                                      minlength=self.classes ** 2).reshape(self.classes, self.classes)
+        return self
+
+    def update_probs(self, masks, probs):
+        # Class probabilities (..., classes) of a predicted batch
+        return self.update(masks, np.asarray(probs).argmax(-1))
+
+    def result(self):
+        # Pixel accuracy, IoU per class and their mean over the classes that occur
+        c = self.confusion
+        tp = np.diag(c).astype(float)
+        union = c.sum(0) + c.sum(1) - tp
+        iou = np.where(union > 0, tp / np.maximum(union, 1), np.nan)
+        return {'pixel_accuracy': float(tp.sum() / max(c.sum(), 1)),
+                'mean_iou': float(np.nanmean(iou)) if np.any(union > 0) else 0.0,
+                'iou': [None if np.isnan(v) else float(v) for v in iou],
+                'pixels': int(c.sum())}
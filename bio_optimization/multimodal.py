@@ -0,0 +1,142 @@
+import numpy as np
+
+from .niching import clearing, nicheoptima, nicheseeds, speciesconserve
+from .profiling import profiled
+from .rng import generator
+
+# Multimodal optimization of cos(3 x1) sin(3 x2) / 3 from
+# "Multimodal optimization based on fitness sharing.ipynb". chromo columns: 0:x_num decision
+# variables, x_num fitness, x_num + 1 niched fitness, x_num + 2 tournament rank.
+
+def function(x):
+    fun = np.cos(3 * x[:,0]) * np.sin(3 * x[:,1]) / 3
+    return fun
+
+
+def initialpop(N,x_num,x_max,x_min,rng=None):
+    rng = generator(rng)
+    chromo = np.zeros([N,x_num + 3])
+    chromo[:,0:x_num] = x_min + (x_max - x_min) * rng.random((N,x_num))
+    chromo[:,x_num] = function(chromo[:,0:x_num])
+
+    return chromo
+
+
+@profiled('multimodal.crossover')
+def crossover(chromo,pc,yita1,N,x_num,x_max,x_min,rng=None):
+    # Simulated binary crossover of N pairs, the random numbers of all pairs are drawn in blocks
+    rng = generator(rng)
+    first = rng.integers(0, len(chromo), N)
+    second = (first + 1 + rng.integers(0, len(chromo) - 1, N)) % len(chromo)
+
+    off_1 = chromo[first, :].copy()
+    off_2 = chromo[second, :].copy()
+
+    cross = rng.random(N) < pc
+    u = rng.random((N,x_num))
+    gama = np.where(u < 0.5, (2 * u)**(1 / (yita1 + 1)), (1 / (2 * (1 - np.minimum(u, 1 - 1e-16))))**(1 / (yita1+1)))
+    x_1, x_2 = off_1[:,0:x_num], off_2[:,0:x_num]
+    new_1 = 0.5 * ((1 + gama) * x_1 + (1 - gama) * x_2)
+    new_2 = 0.5 * ((1 - gama) * x_1 + (1 + gama) * x_2)
+
+    #Modify if the boundary is exceeded
+    off_1[cross,0:x_num] = np.clip(new_1[cross], x_min, x_max)
+    off_2[cross,0:x_num] = np.clip(new_2[cross], x_min, x_max)
+
+    off_s = np.stack((off_1,off_2), axis=1).reshape(2 * N, -1)
+    pick = rng.permutation(len(off_s))[:N]#N randomly selected from 2*N
+    newchromo = off_s[pick,:]
+    newchromo[:,x_num] = function(newchromo[:,0:x_num])
+
+    return newchromo
+
+
+@profiled('multimodal.mutation')
+def mutation(chromo,pm,yita2,N,x_num,x_max,x_min,rng=None):
+    # Polynomial mutation, every dimension of a mutated individual is moved by the formula
+    rng = generator(rng)
+    mutate = rng.random(N) < pm
+    u = rng.random((N,x_num))
+    delta = np.where(u < 0.5, (2 * u)**(1 / (yita2+1)) - 1, 1 - (2 * (1 - u))**(1 / (yita2+1)))
+
+    chromo[:N,0:x_num] = np.clip(chromo[:N,0:x_num] + delta * mutate[:,None], x_min, x_max)
+    chromo[:,x_num] = function(chromo[:,0:x_num])
+
+    return chromo
+
+
+@profiled('multimodal.sharingfitness')
+def sharingfitness(chromo,x_num,sigma,alpha):
+    for i in range(len(chromo)):
+        shsum = 0
+        for j in range(len(chromo)):
+            if i != j:
+                dij = np.sqrt(np.sum((chromo[i,0:x_num] - chromo[j,0:x_num]) ** 2))
+
+                if dij < sigma:
+                    shij = 1 - (dij/sigma)**alpha
+                else:
+                    shij = 0
+
+                shsum = shsum + shij
+
+        if shsum != 0:
+            chromo[i,x_num + 1] = chromo[i,x_num] / shsum
+        else:
+            chromo[i,x_num + 1] = 0
+    return chromo
+
+
+@profiled('multimodal.tournamentselect')
+def tournamentselect(chromo_co,N,x_num,q,rng=None):
+    # Round-robin tournament on the niched fitness, the N individuals with the most wins survive.
+    # The q opponents of every individual are drawn as one block, with replacement
+    rng = generator(rng)
+    pickindex = rng.integers(0, len(chromo_co), (len(chromo_co),q))
+    chromo_co[:, x_num + 2] = np.sum(chromo_co[:, x_num + 1, None] > chromo_co[pickindex, x_num + 1], axis=1)
+
+    chromo_sort = np.array(sorted(chromo_co, key = lambda chromo_co:chromo_co[x_num + 2], reverse=True))
+    chromo = chromo_sort[:N]
+
+    return chromo
+
+
+@profiled('multimodal.selection_normal')
+def selection_normal(chromo_co,N,x_num,x_max,x_min):
+    chromo_sort = np.array(sorted(chromo_co, key = lambda chromo_co:chromo_co[x_num],reverse=True))
+    chromo = np.array(chromo_sort)[:N]
+    return chromo
+
+
+def runMultimodal(method='sharing', N=100, iteration=2000, x_num=2, pc=0.9, yita1=20, yita2=20,
+                  alpha=1, sigma=0.7, q=10, kappa=1, seed=None):
+    # method is one of 'sharing', 'clearing', 'speciation' or 'none'.
+    # Returns the last population and the discovered optima (niche seed, fitness, member count)
+    x_max = np.ones([1,x_num]) * 3
+    x_min = np.ones([1,x_num]) * -3
+    pm = 1 / x_num
+    rng = generator(seed)
+
+    chromo = initialpop(N,x_num,x_max,x_min,rng)
+    for i in range(iteration):
+        parentchromo = chromo.copy()
+        chromo_cros = crossover(chromo,pc,yita1,N,x_num,x_max,x_min,rng)
+        chromo_off = mutation(chromo_cros,pm,yita2,N,x_num,x_max,x_min,rng)
+
+        if method == 'sharing':
+            chromo_co = sharingfitness(np.concatenate((chromo_off,chromo_off)),x_num,sigma,alpha)
+            chromo = tournamentselect(chromo_co,N,x_num,q,rng)
+        elif method == 'clearing':
+            chromo_co = clearing(np.concatenate((parentchromo,chromo_off)),x_num,sigma,kappa)
+            chromo = tournamentselect(chromo_co,N,x_num,q,rng)
+        elif method == 'speciation':
+            _, seeds = nicheseeds(parentchromo,x_num,sigma)
+            chromo_off[:,x_num + 1] = chromo_off[:,x_num]
+            chromo = tournamentselect(np.concatenate((chromo_off,chromo_off)),N,x_num,q,rng)
+            chromo = speciesconserve(chromo,parentchromo[seeds],x_num,sigma)
+        elif method == 'none':
+            chromo = selection_normal(np.concatenate((chromo_off,chromo_off)),N,x_num,x_max,x_min)
+        else:
+            raise ValueError('unknown niching method %r' % method)
+
+    return chromo, nicheoptima(chromo,x_num,sigma)
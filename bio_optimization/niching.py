@@ -0,0 +1,161 @@
+import itertools
+import numpy as np
+
+from .profiling import profiled
+
+# Niching strategies working on the same chromo layout as the fitness sharing notebook:
+# columns 0:x_num are the decision variables, x_num the raw fitness,
+# x_num + 1 the niched fitness used by selection and x_num + 2 the tournament rank.
+#
+# Neighbourhood queries go through a spatial hash with cell size sigma on a few of the axes, so each
+# individual only looks at the 3^h cells around it instead of the whole population. The hashed axes
+# are the widest ones, and h is chosen per call from the spread of the population (hashaxes()).
+# Distances on the hashed axes are never larger than the full distance, so the cells still cover
+# every sigma ball and the results are exact.
+#
+# Dimensional limit: the cost is near linear while the population is spread over many cells on a
+# few axes, e.g. up to 3 dimensions or points near a low-dimensional set. A population spread evenly
+# over many dimensions leaves n * c^h candidates per query (c the share of an axis within one cell)
+# against 3^h lookups, and the best h gives roughly n^1.5 in total, not n. Packed into a few sigma
+# on every axis it is quadratic whatever is hashed.
+
+LOOKUP_COST = 4#Cost of one cell lookup, in candidate distance checks of up to 64 coordinates
+
+
+def hashaxes(x, sigma, maxdim=8):
+    # Axes to hash, widest first. Hashing h axes costs 3^h cell lookups per query and leaves about
+    # n * prod(min(1, 3 sigma / width)) candidates, assuming individuals spread evenly along each axis;
+    # h minimizes the sum
+    n, d = x.shape
+    if n == 0:
+        return np.zeros(0, dtype=int)
+    width = x.max(axis=0) - x.min(axis=0)
+    axes = np.argsort(-width, kind='stable')[:maxdim]
+    frac = np.minimum(1.0, 3 * sigma / np.maximum(width[axes], np.finfo(float).tiny))
+    check = n * (1 + d / 64)
+    cost = [check] + [LOOKUP_COST * 3 ** h + check * np.prod(frac[:h]) for h in range(1, len(axes) + 1)]
+    return axes[:int(np.argmin(cost))]
+
+
+class CellHash:
+    # Integer code of the sigma cell of a point on the hashed axes, and the code offsets of the 3^h
+    # cells around a cell. points fixes the range of the codes, queries have to lie inside it
+    def __init__(self, points, sigma, axes):
+        self.sigma = sigma
+        self.axes = axes
+        keys = np.floor(points[:, axes] / sigma).astype(np.int64)
+        self.low = keys.min(axis=0) - 1
+        span = keys.max(axis=0) - self.low + 2
+        self.stride = np.cumprod(np.r_[1, span])[:-1].astype(np.int64)
+        offsets = np.array(list(itertools.product((-1, 0, 1), repeat=len(axes))), dtype=np.int64).reshape(3 ** len(axes), len(axes))
+        self.offsets = offsets @ self.stride
+
+    def codes(self, x):
+        return (np.floor(x[:, self.axes] / self.sigma).astype(np.int64) - self.low) @ self.stride
+
+
+def hashcells(points, sigma, maxdim=8):
+    # CellHash on the axes hashaxes() picks, leaving out axes whose codes wouldn't fit in int64
+    axes = hashaxes(points, sigma, maxdim)
+    while len(axes):
+        keys = np.floor(points[:, axes] / sigma)
+        if np.sum(np.log2(keys.max(axis=0) - keys.min(axis=0) + 3)) < 62:
+            break
+        axes = axes[:-1]
+    return CellHash(points, sigma, axes)
+
+
+@profiled('niching.nicheseeds')
+def nicheseeds(chromo, x_num, sigma, maxdim=8):
+    # Seeds are found in order of decreasing fitness: an individual becomes a new seed when no
+    # fitter seed lies within sigma, otherwise it joins the fittest seed within sigma.
+    x = chromo[:, 0:x_num]
+    cells = hashcells(x, sigma, maxdim)
+    codes = cells.codes(x)
+    order = np.argsort(-chromo[:, x_num], kind='stable')
+
+    grid = {}#Hash cell -> position of the seeds in that cell
+    seeds = np.zeros(len(chromo), dtype=int)#The first count entries are the seeds found so far
+    count = 0
+    species = np.zeros(len(chromo), dtype=int)#Index of the seed each individual belongs to
+
+    for i in order:
+        owner = count
+        near = [s for cell in (codes[i] + cells.offsets).tolist() for s in grid.get(cell, ())]
+        if near:
+            near = np.array(near)
+            near = near[np.sum((x[seeds[near]] - x[i]) ** 2, axis=1) < sigma ** 2]
+            if len(near):
+                owner = int(near.min())
+        if owner == count:
+            seeds[count] = i
+            count = count + 1
+            grid.setdefault(int(codes[i]), []).append(owner)
+        species[i] = seeds[owner]
+
+    return species, seeds[:count].copy()
+
+
+@profiled('niching.clearing')
+def clearing(chromo, x_num, sigma, kappa=1):
+    # The kappa fittest individuals of each niche keep their fitness, the rest are cleared
+    species, seeds = nicheseeds(chromo, x_num, sigma)
+    order = np.argsort(-chromo[:, x_num], kind='stable')
+
+    sp = species[order]
+    bysp = np.argsort(sp, kind='stable')#Still in decreasing fitness inside each niche
+    sp_sorted = sp[bysp]
+    start = np.r_[0, np.flatnonzero(np.diff(sp_sorted)) + 1]
+    counts = np.diff(np.r_[start, len(sp_sorted)])
+    rank = np.arange(len(sp_sorted)) - np.repeat(start, counts)#Position inside the niche
+
+    winner = np.zeros(len(chromo), dtype=bool)
+    winner[order[bysp]] = rank < kappa
+    chromo[:, x_num + 1] = np.where(winner, chromo[:, x_num], -np.inf)
+
+    return chromo
+
+
+@profiled('niching.speciesconserve')
+def speciesconserve(chromo, seedchromo, x_num, sigma, maxdim=8):
+    # Species conservation: every seed of the previous generation either replaces the worst member
+    # of its species in the new population, or the worst unprotected individual if its species died out
+    x = chromo[:, 0:x_num]
+    cells = hashcells(np.concatenate((x, seedchromo[:, 0:x_num])), sigma, maxdim)
+    grid = {}
+    for j, code in enumerate(cells.codes(x).tolist()):
+        grid.setdefault(code, []).append(j)
+    seedcodes = cells.codes(seedchromo[:, 0:x_num])
+    protected = np.zeros(len(chromo), dtype=bool)
+
+    for n in np.argsort(-seedchromo[:, x_num], kind='stable'):
+        seed = seedchromo[n]
+        near = np.sort([j for cell in (seedcodes[n] + cells.offsets).tolist() for j in grid.get(cell, ())]).astype(int)#Ties go to the first index, whatever the hashed axes
+        near = near[~protected[near]]
+        near = near[np.sum((x[near] - seed[0:x_num]) ** 2, axis=1) < sigma ** 2]
+        worst = int(near[np.argmin(chromo[near, x_num])]) if len(near) else -1
+
+        if worst == -1:
+            free = np.flatnonzero(~protected)
+            if len(free) == 0:
+                break
+            worst = free[np.argmin(chromo[free, x_num])]
+        elif chromo[worst, x_num] >= seed[x_num]:
+            protected[worst] = True
+            continue
+
+        chromo[worst, :] = seed
+        protected[worst] = True
+
+    return chromo
+
+
+@profiled('niching.nicheoptima')
+def nicheoptima(chromo, x_num, sigma):
+    # The discovered optima are the niche seeds, sorted by fitness
+    species, seeds = nicheseeds(chromo, x_num, sigma)
+    members = np.bincount(species, minlength=len(chromo))
+    optima = []
+    for s in seeds:
+        optima.append({'seed': chromo[s, 0:x_num].copy(), 'fitness': chromo[s, x_num], 'members': int(members[s])})
+    return optima
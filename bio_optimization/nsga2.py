@@ -0,0 +1,230 @@
+import numpy as np
+
+from .profiling import profiled
+from .rng import generator
+
+# NSGA-II from NSGA-II.ipynb on the ZDT2 problem. chromo columns: 0:x_num decision variables,
+# x_num:x_num + f_num objective values, x_num + f_num pareto rank, the next two the index of the
+# individual in its layer, the next two the crowding interval per objective and x_num + f_num + 5
+# the crowding distance.
+
+def zdt_2(x):
+    x_num = len(x)
+    f1 = float(x[0])
+    g = float(1 + 9 * (np.sum(x[1:]) / (x_num-1)))
+    f2 = g * (1 - (f1 / g) ** 2)
+    f = [f1,f2]
+    return f
+
+
+def zdt_2_pop(x):
+    # zdt_2 of every row of x at once
+    f1 = x[:,0]
+    g = 1 + 9 * (np.sum(x[:,1:], axis=1) / (x.shape[1]-1))
+    f2 = g * (1 - (f1 / g) ** 2)
+    return np.stack((f1,f2), axis=1)
+
+
+def initialpop(N,x_num,f_num,x_max,x_min,rng=None):
+    rng = generator(rng)
+    chromo = np.zeros([N,x_num + f_num + 6])
+    chromo[:,0:x_num] = x_min + (x_max - x_min) * rng.random((N,x_num))
+    chromo[:,x_num:x_num + 2] = zdt_2_pop(chromo[:,0:x_num])
+    return chromo
+
+
+@profiled('nsga2.nondominsort')
+def nondominsort(chromo,N,x_num,f_num,x_max,x_min):
+    f1 = chromo[:,x_num]
+    f2 = chromo[:,x_num + 1]
+    ps = [[] for i in range(0,len(f1))]#Record which individuals are dominated by individual i
+    pn=[0 for i in range(0,len(f1))]#Record how many individuals i was dominated by
+    F = [[]]
+    rank = [0 for i in range(0, len(f1))]
+
+    for  i in range(0,len(f1)):
+        for j in range (0,len(f1)):
+            if (f1[i] <= f1[j] and f2[i] < f2[j]) or (f1[i] < f1[j] and f2[i] <= f2[j]):
+                ps[i].append(j)#Individual i dominates individual j, recording the individual
+            elif (f1[j] <= f1[i] and f2[j] < f2[i]) or (f1[j] < f1[i] and f2[j] <= f2[i]):
+                pn[i] = pn[i] + 1# i is dominated by individual j, count +1
+
+        if pn[i] == 0:#No individual can dominate i. Then i is a non-dominant individual
+            rank[i] = 0
+            F[0].append(i)
+
+    i = 0
+    while (F[i] != []):
+        temp = []
+        for m in F[i] :
+            for n in ps[m]:
+                pn[n] = pn[n] -1
+                if pn[n] == 0 :#Determine if it becomes a non-dominated solution
+                    rank[n] = i + 1
+                    temp.append(n)#Statistics pareto 'rank+1' level of the solution
+        i = i + 1 #Then count the next level
+        F.append(temp) #Record which individuals are included in the 'rank' hierarchy
+
+    del F[len(F)-1]#Delete the last empty level
+
+    chromo[:,x_num + f_num] = rank
+
+    return F
+
+
+@profiled('nsga2.crowddissort')
+def crowddissort(chromo,F,N,x_num,f_num,x_max,x_min):
+    temp = np.array(sorted(chromo, key = lambda chromo:chromo[x_num + f_num]))#Populations sorted by pareto rank
+    chromo_cd = []
+
+    for f in range(len(F)):
+        length = len(F[f])#How many individuals are included in this pareto rank layer
+        y = temp[0:length,:]#Fetch all the individuals in this pareto rank layer. (temp is ranked)
+        temp = temp[length:,:]#Clear the pareto rank layer of individuals
+
+        for i in range(f_num):
+            y[:,x_num + f_num + i + 1] = np.arange(len(y))#Index of the individual in its layer
+            y_sort = np.array(sorted(y, key = lambda y:y[x_num + i]))#Population in the rank layer sorted by the i-th target value
+            index = y_sort[:,x_num + f_num + i + 1].astype(int)
+
+            f_min = y_sort[0,x_num + i]#The minimum value of the i-th target in the layer
+            f_max = y_sort[length - 1,x_num + i]#The maximum value of the i-th target in the layer
+            y[index[0], x_num + f_num + i + 3] = float("inf")#Set the individual interval with the smallest target value to infinite
+            y[index[length - 1], x_num + f_num + i + 3] = float("inf")#The individual interval with the largest target value is set to infinite
+
+            #Calculate the interval of other individuals
+            for j in range(1, length - 1):
+                pre_f = y_sort[j-1,x_num + i]#The i-th target value of the previous one of j
+                next_f = y_sort[j + 1,x_num + i]#The i-th target value of the next j
+                if (f_max - f_min == 0):
+                    y[index[j], x_num + f_num + i + 3] = float("inf")
+                else:
+                    y[index[j], x_num + f_num + i + 3] = float((next_f-pre_f)/(f_max-f_min))
+
+        #Calculating crowding
+        y[:,x_num + f_num + 5] = y[:,x_num + f_num + 3] + y[:,x_num + f_num + 4]
+        chromo_cd.append(y)
+
+    chromo = np.concatenate(chromo_cd, axis=0)
+
+    return chromo
+
+
+@profiled('nsga2.tournamentselect')
+def tournamentselect(chromo,F,N,x_num,f_num,x_max,x_min,rng=None):
+    # N tournaments of round(N/2) individuals each, drawn in blocks of rows. Lowest pareto rank wins,
+    # then the largest crowding distance, remaining ties are broken at random
+    rng = generator(rng)
+    pick = []#Record the selected individuals
+    a=round(N/2)
+    rows = max(1, 2**22 // len(chromo))#Keeps one block of random keys around 16 MB
+
+    for i in range(0, N, rows):
+        n = min(rows, N - i)
+        index_pick = np.argpartition(rng.random((n,len(chromo)), dtype=np.float32), a - 1, axis=1)[:,:a]#k individuals were randomly selected for comparison
+        rank_pick = chromo[index_pick,x_num + f_num]#Pareto hierarchy of the selected k individuals
+        dis_pick = chromo[index_pick,x_num + f_num + 5]#The crowding of the selected k individuals
+        order = np.lexsort((rng.random(index_pick.shape), -dis_pick, rank_pick), axis=1)
+        pick.extend(index_pick[np.arange(n), order[:,0]].tolist())#Record Index
+
+    return pick
+
+
+@profiled('nsga2.crossover')
+def crossover(chromo,F,pick,pc,yita1,N,x_num,f_num,x_max,x_min,rng=None):
+    # Simulated binary crossover of N pairs, the random numbers of all pairs are drawn in blocks
+    rng = generator(rng)
+    pick = np.asarray(pick)
+
+    #Pick out two different individuals to cross
+    first = rng.integers(0, len(pick), N)
+    second = (first + 1 + rng.integers(0, len(pick) - 1, N)) % len(pick)
+    if len(set(pick.tolist())) > 1:
+        same = np.flatnonzero(pick[first] == pick[second])
+        while len(same):
+            second[same] = (first[same] + 1 + rng.integers(0, len(pick) - 1, len(same))) % len(pick)
+            same = same[pick[first[same]] == pick[second[same]]]
+
+    off_1 = chromo[pick[first], :].copy()
+    off_2 = chromo[pick[second], :].copy()
+
+    #Each dimension is crossed by the formula
+    cross = rng.random(N) < pc
+    u = rng.random((N,x_num))
+    gama = np.where(u < 0.5, (2 * u)**(1 / (yita1 + 1)), (1 / (2 * (1 - np.minimum(u, 1 - 1e-16))))**(1 / (yita1+1)))
+    x_1, x_2 = off_1[:,0:x_num], off_2[:,0:x_num]
+    new_1 = 0.5 * ((1 + gama) * x_1 + (1 - gama) * x_2)
+    new_2 = 0.5 * ((1 - gama) * x_1 + (1 + gama) * x_2)
+
+    #Modify if the boundary is exceeded
+    off_1[cross,0:x_num] = np.clip(new_1[cross], x_min, x_max)
+    off_2[cross,0:x_num] = np.clip(new_2[cross], x_min, x_max)
+
+    off_s = np.stack((off_1,off_2), axis=1).reshape(2 * N, -1)
+    pick = rng.permutation(len(off_s))[:N]#N randomly selected from 2*N
+    chromo = off_s[pick,:]
+
+    return chromo
+
+
+@profiled('nsga2.mutation')
+def mutation(chromo,F,pick,pm,yita2,N,x_num,f_num,x_max,x_min,rng=None):
+    # Polynomial mutation, every dimension of a mutated individual is moved by the formula
+    rng = generator(rng)
+    mutate = rng.random(N) < pm
+    u = rng.random((N,x_num))
+    delta = np.where(u < 0.5, (2 * u)**(1 / (yita2+1)) - 1, 1 - (2 * (1 - u))**(1 / (yita2+1)))
+
+    chromo[:N,0:x_num] = np.clip(chromo[:N,0:x_num] + delta * mutate[:,None], x_min, x_max)
+    chromo[:N,x_num:x_num+2] = zdt_2_pop(chromo[:N,0:x_num])#Calculate the value of each objective function
+
+    return chromo
+
+
+@profiled('nsga2.elitism')
+def elitism(chromo_co,N,x_num,f_num,x_max,x_min):
+    chromo = []
+    rank = 0
+
+    while len(chromo) < N and rank <= chromo_co[:,x_num + f_num].max():
+        # Take pareto rank whole layer
+        index = np.flatnonzero(chromo_co[:,x_num + f_num] == rank)
+        temp = sorted(chromo_co[index,:], key = lambda temp:temp[x_num + f_num + 5],reverse=True)
+        chromo.extend(temp)
+        rank = rank + 1
+
+    chromo = np.array(chromo)[0:N,:]
+
+    return chromo
+
+
+@profiled('nsga2.generation')
+def generation(chromo,F,pc,pm,yita1,yita2,N,x_num,f_num,x_max,x_min,rng=None):
+    # One NSGA-II generation: select, crossover, mutate, merge with the parents and keep the elite
+    rng = generator(rng)
+    pick = tournamentselect(chromo,F,N,x_num,f_num,x_max,x_min,rng)
+    chromo_cros = crossover(chromo,F,pick,pc,yita1,N,x_num,f_num,x_max,x_min,rng)
+    chromo_off = mutation(chromo_cros,F,pick,pm,yita2,N,x_num,f_num,x_max,x_min,rng)
+
+    chromo_co = np.concatenate((chromo,chromo_off),axis=0)#The number of populations is 2*N
+    F_co = nondominsort(chromo_co,N,x_num,f_num,x_max,x_min)
+    chromo_cd_co = crowddissort(chromo_co,F_co,N,x_num,f_num,x_max,x_min)
+    chromo = elitism(chromo_cd_co,N,x_num,f_num,x_max,x_min)
+    F = nondominsort(chromo,N,x_num,f_num,x_max,x_min)
+    return crowddissort(chromo,F,N,x_num,f_num,x_max,x_min), F
+
+
+def runNSGA2(N=100, x_num=30, iteration=500, pc=0.9, yita1=20, yita2=20, seed=None):
+    rng = generator(seed)
+    f_num = 2
+    x_min = np.zeros((1,x_num))
+    x_max = np.ones((1,x_num))
+    pm = 1 / x_num
+
+    chromo = initialpop(N,x_num,f_num,x_max,x_min,rng)
+    F = nondominsort(chromo,N,x_num,f_num,x_max,x_min)
+    chromo = crowddissort(chromo,F,N,x_num,f_num,x_max,x_min)
+    for i in range(iteration):
+        chromo, F = generation(chromo,F,pc,pm,yita1,yita2,N,x_num,f_num,x_max,x_min,rng)
+
+    return np.array(sorted(chromo,key=lambda chromo:chromo[x_num]))
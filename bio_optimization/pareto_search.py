@@ -0,0 +1,175 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import profiling
+from .abc_search import (count_trained, mean_cost, measure, neighbour_candidate, pick_partners, random_candidate,
+                         seeded)
+from .ledger import trial_row
+from .rng import generator, seed_sequence, stream
+
+# Multi-objective hyperparameter search: accuracy against training seconds and inference latency.
+# Selection follows NSGA-II (non-dominated sorting, crowding distance, elitism, see NSGA-II.ipynb),
+# new candidates come from the ABC neighbourhood move. Every evaluated candidate is kept so the
+# Pareto front covers the whole search and not only the last population.
+
+def train_time(trial):
+    # Training seconds as reported by evaluate, without its validation and latency benchmark. The
+    # measured wall time stands in for evaluators that don't report it
+    return trial.get('train_time', trial['wall_time'])
+
+
+def objectives(trial):
+    # All objectives are minimized, evaluate has to report 'latency' (seconds per inference batch)
+    return [-trial['accuracy'], train_time(trial), trial['latency']]
+
+
+def usable(trial, keys=('accuracy', 'latency')):
+    # Failed evaluations (with an 'error') and measurements missing an objective take no part in selection
+    return 'error' not in trial and all(k in trial for k in keys)
+
+
+@profiling.profiled('pareto.nondominsort')
+def nondominsort(objs):
+    # objs is (n, f_num), returns the pareto fronts F and the rank of each individual
+    objs = np.asarray(objs, dtype=float)
+    le = np.all(objs[:, None, :] <= objs[None, :, :], axis=2)
+    lt = np.any(objs[:, None, :] < objs[None, :, :], axis=2)
+    dominates = le & lt#dominates[i, j]: individual i dominates individual j
+    pn = dominates.sum(axis=0)#How many individuals dominate j
+
+    rank = np.zeros(len(objs), dtype=int)
+    F = []
+    current = np.flatnonzero(pn == 0)
+    while len(current):
+        rank[current] = len(F)
+        F.append(list(current))
+        pn = pn - dominates[current].sum(axis=0)
+        pn[current] = -1#Already ranked
+        current = np.flatnonzero(pn == 0)
+    return F, rank
+
+
+@profiling.profiled('pareto.crowddissort')
+def crowddissort(objs, F):
+    # Crowding distance inside each front, boundary individuals get infinity
+    objs = np.asarray(objs, dtype=float)
+    distance = np.zeros(len(objs))
+    for front in F:
+        front = np.asarray(front)
+        if len(front) <= 2:
+            distance[front] = np.inf
+            continue
+        for i in range(objs.shape[1]):
+            order = front[np.argsort(objs[front, i], kind='stable')]
+            f_min, f_max = objs[order[0], i], objs[order[-1], i]
+            distance[order[0]] = distance[order[-1]] = np.inf
+            if f_max - f_min == 0:
+                continue
+            distance[order[1:-1]] += (objs[order[2:], i] - objs[order[:-2], i]) / (f_max - f_min)
+    return distance
+
+
+def tournamentselect(rank, distance, k=2, rng=None):
+    # Lower rank wins, ties are broken by the larger crowding distance
+    pick = generator(rng).choice(len(rank), min(k, len(rank)), replace=False)
+    return int(min(pick, key=lambda i: (rank[i], -distance[i])))
+
+
+@profiling.profiled('pareto.elitism')
+def elitism(objs, N):
+    # Take whole pareto fronts, the last one by decreasing crowding distance
+    F, rank = nondominsort(objs)
+    distance = crowddissort(objs, F)
+    chosen = []
+    for front in F:
+        front = sorted(front, key=lambda i: -distance[i])
+        chosen.extend(front[:N - len(chosen)])
+        if len(chosen) >= N:
+            break
+    return chosen
+
+
+def pareto_front(trials):
+    F, rank = nondominsort([objectives(t) for t in trials])
+    return [trials[i] for i in F[0]] if F else []
+
+
+def cheapest_within(trials, tol=0.01, cost='latency'):
+    # Cheapest configuration whose accuracy is within tol (relative) of the best accuracy, among the
+    # trials that report cost
+    trials = [t for t in trials if usable(t, ('accuracy', cost))]
+    if not trials:
+        raise ValueError('no successful trial reports %r' % cost)
+    maxacc = max(t['accuracy'] for t in trials)
+    good = [t for t in trials if t['accuracy'] >= (1 - tol) * maxacc]
+    return min(good, key=lambda t: t[cost])
+
+
+def pareto_abc(evaluate, N=6, max_gen=5, n_workers=1, seed=None, ledger=None, cache=None, budget=None,
+               max_evals=None):
+    # evaluate returns a dict with 'accuracy' and 'latency', and 'train_time' if it can tell training
+    # from the rest of the evaluation, see train_time(). Failed trials are logged and returned under
+    # 'failed' but never selected.
+    # Offspring are drawn before a generation is evaluated, from that generation's own stream, so a
+    # seeded run gives the same result for any n_workers. ledger and cache work as in abc_search.abc(),
+    # the fitness column holds the accuracy. With a budget in seconds no generation is started that the
+    # mean evaluation time says won't finish in time, with max_evals the last generation is cut short.
+    ss = None if seed is None else seed_sequence(seed)
+    root = seed_sequence(ss)
+    start = time.perf_counter()
+    evaluations = []
+    failed = []
+
+    def run(candidates, bees, phase, gen=None):
+        key = (phase,) if gen is None else (phase, gen)
+        calls = [seeded(c, ss, *key, n) for n, c in enumerate(candidates)]
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            measurements = list(executor.map(lambda c: measure(evaluate, c, cache), calls))
+        count_trained(measurements)
+        evaluations.extend(measurements)
+        if ledger is not None:
+            generation = 0 if gen is None else gen + 1
+            for bee, call, m in zip(bees, calls, measurements):
+                ledger.append(trial_row(phase, generation, int(bee), call, m, m['accuracy']))
+        results = [dict(m, candidate=c) for c, m in zip(candidates, measurements)]
+        failed.extend(t for t in results if not usable(t))
+        return [t for t in results if usable(t)]
+
+    def remaining():
+        return float('inf') if budget is None else budget - (time.perf_counter() - start)
+
+    with profiling.phase('pareto.init'):
+        rng = stream(root, 'init')
+        population = run([random_candidate(rng) for i in range(N)], range(N), 'init')
+    if not population:
+        raise RuntimeError('no initial candidate was evaluated successfully')
+    trials = list(population)
+    record = []
+
+    for gen in range(max_gen):
+        size = N if max_evals is None else min(N, max_evals - len(evaluations))
+        if size <= 0 or remaining() < mean_cost(evaluations) * -(-size // n_workers):
+            break
+        objs = [objectives(t) for t in population]
+        F, rank = nondominsort(objs)
+        distance = crowddissort(objs, F)
+        colony = [t['candidate'] for t in population]
+
+        rng = stream(root, 'offspring', gen)
+        sources = [tournamentselect(rank, distance, rng=rng) for n in range(size)]
+        partners = pick_partners(sources, len(colony), rng)
+        fai = rng.uniform(-1, 1, size)
+        offspring = [neighbour_candidate(colony, i, k, fai=f) for i, k, f in zip(sources, partners, fai)]
+        with profiling.phase('pareto.evaluate', generation=gen + 1):
+            offspring = run(offspring, sources, 'offspring', gen)
+        trials.extend(offspring)
+
+        # Population merging and elite retention
+        merged = population + offspring
+        population = [merged[i] for i in elitism([objectives(t) for t in merged], N)]
+        record.append([gen + 1, len(pareto_front(trials)), max(t['accuracy'] for t in population)])
+
+    return {'population': population, 'front': pareto_front(trials), 'trials': trials, 'failed': failed,
+            'record': record, 'elapsed': time.perf_counter() - start}
@@ -0,0 +1,277 @@
+import contextlib
+import functools
+import json
+import os
+import resource
+import threading
+import time
+
+# Lightweight per-phase instrumentation for the optimizer runs.
+#
+#   with profiling.profile(profiling.SummarySink(), profiling.ChromeTraceSink('trace.json')) as sinks:
+#       abc(evaluate)
+#   print(profiling.format_summary(sinks[0].summary()))
+#
+# Code marks phases with `with profiling.phase('employed'):` or `@profiling.profiled('nondominsort')`
+# and counts evaluations with profiling.count(). While no sink is installed phase() returns a shared
+# no-op context manager, so instrumented code pays one function call and one truthiness test.
+# Every closed phase is one record: name, tags, start, wall and CPU seconds, evaluation count and
+# the peak RSS sampled while the phase was open. The Chrome trace opens in Perfetto or chrome://tracing.
+# CPU seconds are those of the whole process, so TensorFlow's and tf.data's own threads count; phases
+# open at the same time in several threads each count the CPU time of all of them, and so does RSS.
+
+_sinks = []
+_local = threading.local()
+_origin = time.perf_counter()
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullPhase()
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def current_rss():
+    # Resident set size right now from /proc on Linux, elsewhere only the high-water mark is known
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return peak_rss()
+
+
+class _RSSMonitor:
+    # One background thread samples the RSS every interval seconds for every open RSSSampler and
+    # phase, and exits when none is left open
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.open = set()
+        self.thread = None
+
+    def add(self, sampler):
+        with self.lock:
+            self.open.add(sampler)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='RSSMonitor', daemon=True)
+                self.thread.start()
+
+    def remove(self, sampler):
+        with self.lock:
+            self.open.discard(sampler)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            rss = current_rss()
+            with self.lock:
+                if not self.open:
+                    self.thread = None
+                    return
+                for sampler in self.open:
+                    sampler.peak = max(sampler.peak, rss)
+
+
+_monitor = _RSSMonitor()
+
+
+class RSSSampler:
+    # Peak RSS while the block runs. Memory is per process, so evaluations running in parallel
+    # threads each see the peak of all of them
+    def __init__(self):
+        self.peak = 0
+
+    def __enter__(self):
+        self.peak = current_rss()
+        _monitor.add(self)
+        return self
+
+    def __exit__(self, *exc):
+        _monitor.remove(self)
+        self.peak = max(self.peak, current_rss())
+        return False
+
+
+class _Phase:
+    __slots__ = ('name', 'tags', 'start', 'cpu', 'evaluations', 'peak')
+
+    def __init__(self, name, tags):
+        self.name = name
+        self.tags = tags
+        self.evaluations = 0
+        self.peak = 0
+
+    def __enter__(self):
+        _stack().append(self)
+        self.peak = current_rss()
+        _monitor.add(self)
+        self.start = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.start
+        cpu = time.process_time() - self.cpu
+        _monitor.remove(self)
+        self.peak = max(self.peak, current_rss())
+        stack = _stack()
+        stack.pop()
+        if stack:
+            stack[-1].evaluations += self.evaluations
+        emit({'name': self.name, 'tags': self.tags, 'start': self.start - _origin, 'wall': wall, 'cpu': cpu,
+              'evaluations': self.evaluations, 'peak_rss': self.peak, 'thread': threading.get_ident(),
+              'depth': len(stack)})
+        return False
+
+
+def enabled():
+    return bool(_sinks)
+
+
+def phase(name, **tags):
+    if not _sinks:
+        return _NULL
+    return _Phase(name, tags)
+
+
+def profiled(name=None):
+    # Decorator form of phase()
+    def decorate(fn):
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return fn(*args, **kwargs)
+            with _Phase(label, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(n=1):
+    # Evaluations done inside the current phase, they also add up in the enclosing phases
+    if _sinks:
+        stack = _stack()
+        if stack:
+            stack[-1].evaluations += n
+
+
+def record(name, start, wall, cpu=None, evaluations=0, peak_rss=None, **tags):
+    # Adds a phase that was measured elsewhere, e.g. aggregated from a Keras callback. Without a
+    # peak_rss the RSS at the time of the call is recorded
+    if _sinks:
+        emit({'name': name, 'tags': tags, 'start': start - _origin, 'wall': wall, 'cpu': cpu,
+              'evaluations': evaluations, 'peak_rss': current_rss() if peak_rss is None else peak_rss,
+              'thread': threading.get_ident(), 'depth': len(_stack())})
+
+
+def emit(rec):
+    for sink in list(_sinks):
+        sink.emit(rec)
+
+
+def enable(*sinks):
+    _sinks.extend(sinks)
+
+
+def disable():
+    while _sinks:
+        _sinks.pop().close()
+
+
+@contextlib.contextmanager
+def profile(*sinks):
+    # Installs the sinks for the duration of the block and closes them afterwards
+    enable(*sinks)
+    try:
+        yield sinks
+    finally:
+        for sink in sinks:
+            if sink in _sinks:
+                _sinks.remove(sink)
+            sink.close()
+
+
+class SummarySink:
+    # Totals per phase name, kept in memory
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}
+
+    def emit(self, rec):
+        with self.lock:
+            s = self.phases.setdefault(rec['name'], {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'evaluations': 0, 'peak_rss': 0})
+            s['calls'] += 1
+            s['wall'] += rec['wall']
+            s['cpu'] += rec['cpu'] or 0.0
+            s['evaluations'] += rec['evaluations']
+            s['peak_rss'] = max(s['peak_rss'], rec['peak_rss'])
+
+    def summary(self):
+        with self.lock:
+            return {name: dict(s) for name, s in self.phases.items()}
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink:
+    # One JSON object per closed phase
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, 'w')
+
+    def emit(self, rec):
+        line = json.dumps(rec, default=str)
+        with self.lock:
+            self.file.write(line + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class ChromeTraceSink:
+    # Trace event format, complete ('X') events in microseconds, written on close
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.events = []
+
+    def emit(self, rec):
+        args = dict(rec['tags'], cpu=rec['cpu'], evaluations=rec['evaluations'], peak_rss=rec['peak_rss'])
+        event = {'name': rec['name'], 'ph': 'X', 'ts': rec['start'] * 1e6, 'dur': rec['wall'] * 1e6,
+                 'pid': os.getpid(), 'tid': rec['thread'], 'args': args}
+        with self.lock:
+            self.events.append(event)
+
+    def close(self):
+        with self.lock:
+            events = sorted(self.events, key=lambda e: e['ts'])
+        with open(self.path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+
+
+def format_summary(summary):
+    lines = ['%-28s %8s %12s %12s %8s %10s' % ('phase', 'calls', 'wall s', 'cpu s', 'evals', 'rss MB')]
+    for name, s in sorted(summary.items(), key=lambda item: -item[1]['wall']):
+        lines.append('%-28s %8d %12.4f %12.4f %8d %10.1f' % (name, s['calls'], s['wall'], s['cpu'], s['evaluations'],
+                                                             s['peak_rss'] / 2**20))
+    return '\n'.join(lines)
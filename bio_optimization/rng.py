@@ -0,0 +1,49 @@
+import zlib
+
+import numpy as np
+
+# Reproducible random streams for the optimizers. Everything random is drawn from numpy Generators
+# derived from one master seed with SeedSequence, one independent stream per island, worker, bee
+# phase or evaluation. A stream is addressed by what it is for, not by which worker happens to
+# consume it, so a parallel run with a given master seed gives the same numbers for any worker count.
+#
+# Operators take an optional rng; without one they share a process-wide default stream.
+
+_default = None
+
+
+def seed_sequence(seed=None):
+    # Fixes the entropy of an unseeded run once, so all streams of the run derive from it
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def generator(seed=None):
+    # A Generator for seed, a Generator passes through, None gives the shared default stream
+    global _default
+    if isinstance(seed, np.random.Generator):
+        return seed
+    if seed is None:
+        if _default is None:
+            _default = np.random.Generator(np.random.PCG64())
+        return _default
+    return np.random.Generator(np.random.PCG64(seed_sequence(seed)))
+
+
+def _key(k):
+    return zlib.crc32(k.encode()) if isinstance(k, str) else int(k)
+
+
+def stream(seed, *key):
+    # The stream named by key below seed, e.g. stream(ss, 'employed', generation). Same key, same numbers
+    ss = seed_sequence(seed)
+    child = np.random.SeedSequence(ss.entropy, spawn_key=tuple(ss.spawn_key) + tuple(_key(k) for k in key),
+                                   pool_size=ss.pool_size)
+    return np.random.Generator(np.random.PCG64(child))
+
+
+def seed_int(seed, *key):
+    # 31-bit integer seed for libraries with their own RNG (TensorFlow)
+    return int(stream(seed, *key).integers(2**31 - 1))
+
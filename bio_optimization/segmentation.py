@@ -0,0 +1,418 @@
+import collections
+import functools
+import importlib
+import time
+
+from . import profiling
+from .abc_search import history_accuracy
+from .metrics import SegmentationMetrics
+from .rng import generator
+
+# UNet segmentation of the Oxford-IIIT Pet dataset, the model trained and scored for every ABC candidate.
+# TensorFlow and tensorflow_datasets are imported on first use, importing this module is free.
+
+def _tf():
+    return importlib.import_module('tensorflow')
+
+
+def resize(input_image, input_mask):
+    tf = _tf()
+    input_image = tf.image.resize(input_image, (128, 128), method="nearest")
+    input_mask = tf.image.resize(input_mask, (128, 128), method="nearest")
+    return input_image, input_mask
+
+
+# Seed of the training set flips. With the index of the image the flip is a stateless draw, the
+# same image is flipped the same way in every run whatever the thread or the global seed
+AUGMENT_SEED = 0
+
+
+def augment(input_image, input_mask, index=None):
+    tf = _tf()
+    if index is None:
+        u = tf.random.uniform(())
+    else:
+        u = tf.random.stateless_uniform((), seed=tf.stack([tf.constant(AUGMENT_SEED, tf.int64), tf.cast(index, tf.int64)]))
+    if u > 0.5:
+        # Random flipping of the image and mask
+        input_image = tf.image.flip_left_right(input_image)
+        input_mask = tf.image.flip_left_right(input_mask)
+
+    return input_image, input_mask
+
+
+def normalize(input_image, input_mask):
+    tf = _tf()
+    input_image = tf.cast(input_image, tf.float32) / 255.0
+    input_mask -= 1
+    return input_image, input_mask
+
+
+def load_image_train(datapoint, index=None):
+    input_image = datapoint["image"]
+    input_mask = datapoint["segmentation_mask"]
+    input_image, input_mask = resize(input_image, input_mask)
+    input_image, input_mask = augment(input_image, input_mask, index)
+    input_image, input_mask = normalize(input_image, input_mask)
+
+    return input_image, input_mask
+
+
+def load_image_test(datapoint):
+    input_image = datapoint["image"]
+    input_mask = datapoint["segmentation_mask"]
+    input_image, input_mask = resize(input_image, input_mask)
+    input_image, input_mask = normalize(input_image, input_mask)
+
+    return input_image, input_mask
+
+
+@functools.lru_cache(maxsize=None)
+@profiling.profiled('segmentation.load_data')
+def load_data():
+    # (info, train_dataset, test_dataset), loaded once per process
+    tf = _tf()
+    tfds = importlib.import_module('tensorflow_datasets')
+    dataset, info = tfds.load('oxford_iiit_pet:3.*.*', with_info=True)
+    train_dataset = dataset["train"].enumerate().map(lambda index, datapoint: load_image_train(datapoint, index),
+                                                     num_parallel_calls=tf.data.AUTOTUNE).cache()
+    test_dataset = dataset["test"].map(load_image_test, num_parallel_calls=tf.data.AUTOTUNE)
+    return info, train_dataset, test_dataset
+
+
+BUFFER_SIZE = 1000
+
+# The first 3000 test images are the validation split the search scores candidates on, in
+# VALIDATION_SHARDS contiguous shards. TFDS shuffles the examples when it prepares the dataset, so
+# the leading shards are a random subsample and reading them stops early.
+VALIDATION_SIZE = 3000
+VALIDATION_SHARDS = 10
+
+
+def validation_shards(batch_size, shards=None):
+    # Batches of the first shards validation shards, the whole validation split when shards is None
+    tf = _tf()
+    info, train_dataset, test_dataset = load_data()
+    shards = VALIDATION_SHARDS if shards is None else max(1, min(shards, VALIDATION_SHARDS))
+    validation = test_dataset.take(VALIDATION_SIZE * shards // VALIDATION_SHARDS)
+    return validation.batch(batch_size).prefetch(buffer_size=tf.data.experimental.AUTOTUNE)
+
+
+def shuffled_batches(batch_size, seed=None):
+    # Repeated training batches. A seed fixes the shuffle order of every epoch
+    tf = _tf()
+    info, train_dataset, test_dataset = load_data()
+    train_batches = train_dataset.shuffle(BUFFER_SIZE, seed=seed).batch(batch_size).repeat()
+    return train_batches.prefetch(buffer_size=tf.data.experimental.AUTOTUNE)
+
+
+@functools.lru_cache(maxsize=None)
+def load_batches(batch_size):
+    # (info, train_batches, validation_batches, test_batches) for one batch size
+    info, train_dataset, test_dataset = load_data()
+    train_batches = shuffled_batches(batch_size)
+    validation_batches = validation_shards(batch_size)
+    test_batches = test_dataset.skip(VALIDATION_SIZE).take(669).batch(batch_size)
+    return info, train_batches, validation_batches, test_batches
+
+
+def layer_seeds(seed):
+    # Seeds of the layers of one model, drawn from the model's seed. Seeded layers don't touch the
+    # global TensorFlow seed, so models built in parallel threads don't interfere
+    rng = generator(seed)
+    while True:
+        yield int(rng.integers(2**31 - 1))
+
+
+def layer_seed(seeds):
+    # None leaves the layer to TensorFlow's global RNG
+    return None if seeds is None else next(seeds)
+
+
+def double_conv_block(x, n_filters, seeds=None):
+    tf = _tf()
+    layers = tf.keras.layers
+    # Conv2D then ReLU activation
+    x = layers.Conv2D(n_filters, 3, padding = "same", activation = "relu",
+                      kernel_initializer = tf.keras.initializers.HeNormal(seed=layer_seed(seeds)))(x)
+    # Conv2D then ReLU activation
+    x = layers.Conv2D(n_filters, 3, padding = "same", activation = "relu",
+                      kernel_initializer = tf.keras.initializers.HeNormal(seed=layer_seed(seeds)))(x)
+
+    return x
+
+
+def downsample_block(x, n_filters, POOLING_TYPE, DROPOUT_RATE, seeds=None):
+    layers = _tf().keras.layers
+    f = double_conv_block(x, n_filters, seeds)
+
+    if POOLING_TYPE == 'MP':
+        p = layers.MaxPooling2D(2)(f)
+
+    elif POOLING_TYPE == 'AP':
+        p = layers.AveragePooling2D(2)(f)
+
+    else:
+        raise ValueError('unknown pooling type %r' % POOLING_TYPE)
+    g = layers.Dropout(DROPOUT_RATE, seed=layer_seed(seeds))(p)
+
+    return f,g
+
+
+def upsample_block(x, conv_features, n_filters, DROPOUT_RATE, seeds=None):
+    tf = _tf()
+    layers = tf.keras.layers
+    # upsample
+    x = layers.Conv2DTranspose(n_filters, 3, 2, padding="same",
+                               kernel_initializer=tf.keras.initializers.GlorotUniform(seed=layer_seed(seeds)))(x)
+    # concatenate
+    x = layers.concatenate([x, conv_features])
+    # dropout
+    x = layers.Dropout(DROPOUT_RATE, seed=layer_seed(seeds))(x)
+    # Conv2D twice with ReLU activation
+    x = double_conv_block(x, n_filters, seeds)
+
+    return x
+
+
+# Architecture of the original network: 64/128/256/512 filters, four downsampling levels, a one
+# filter bottleneck, run at the 128x128 resolution of the data pipeline
+BASE_FILTERS = 64
+DEPTH = 4
+BOTTLENECK_FILTERS = 1
+INPUT_SIZE = 128
+N_CLASSES = 3
+
+
+def check_architecture(DEPTH, INPUT_SIZE):
+    if DEPTH < 1 or INPUT_SIZE % 2**DEPTH:
+        raise ValueError('input size %d does not halve %d times' % (INPUT_SIZE, DEPTH))
+
+
+def build_unet_model(POOLING_TYPE, DROPOUT_RATE, BASE_FILTERS=BASE_FILTERS, DEPTH=DEPTH,
+                     BOTTLENECK_FILTERS=BOTTLENECK_FILTERS, INPUT_SIZE=INPUT_SIZE, SEED=None): # inputs
+    # Level l of the encoder has BASE_FILTERS * 2**l filters. The model always takes and returns
+    # 128x128 images; with a smaller INPUT_SIZE the image is downscaled on the way in and the
+    # class scores are upscaled before the softmax, so the network itself runs at INPUT_SIZE.
+    # A SEED seeds every initializer and dropout layer of the model
+    tf = _tf()
+    layers = tf.keras.layers
+    check_architecture(DEPTH, INPUT_SIZE)
+    seeds = None if SEED is None else layer_seeds(SEED)
+    inputs = layers.Input(shape=(128,128,3))
+    x = inputs if INPUT_SIZE == 128 else layers.Resizing(INPUT_SIZE, INPUT_SIZE)(inputs)
+
+    # encoder: contracting path - downsample
+    features = []
+    for level in range(DEPTH):
+        f, x = downsample_block(x, BASE_FILTERS * 2**level, POOLING_TYPE, DROPOUT_RATE, seeds)
+        features.append(f)
+
+    # bottleneck
+    x = double_conv_block(x, BOTTLENECK_FILTERS, seeds)
+
+    # decoder: expanding path - upsample
+    for level in reversed(range(DEPTH)):
+        x = upsample_block(x, features[level], BASE_FILTERS * 2**level, DROPOUT_RATE, seeds)
+
+    # outputs
+    initializer = tf.keras.initializers.GlorotUniform(seed=layer_seed(seeds))
+    if INPUT_SIZE == 128:
+        outputs = layers.Conv2D(N_CLASSES, 1, padding="same", activation = "softmax", kernel_initializer=initializer)(x)
+    else:
+        x = layers.Conv2D(N_CLASSES, 1, padding="same", kernel_initializer=initializer)(x)
+        x = layers.Resizing(128, 128, interpolation="bilinear")(x)
+        outputs = layers.Softmax()(x)
+
+    # unet model with Keras Functional API
+    unet_model = tf.keras.Model(inputs, outputs, name="U-Net")
+
+    return unet_model
+
+
+def unet_cost(BASE_FILTERS=BASE_FILTERS, DEPTH=DEPTH, BOTTLENECK_FILTERS=BOTTLENECK_FILTERS, INPUT_SIZE=INPUT_SIZE):
+    # Parameter count and FLOPs (two per multiply-add) of one image through build_unet_model,
+    # counted from the convolutions without building the model. Pooling, dropout and resizing are left out
+    params = flops = 0
+
+    def conv(size, n_in, n_out, kernel=3):
+        nonlocal params, flops
+        params += kernel * kernel * n_in * n_out + n_out
+        flops += 2 * size * size * kernel * kernel * n_in * n_out
+
+    check_architecture(DEPTH, INPUT_SIZE)
+    n_in = 3
+    for level in range(DEPTH):
+        size, n_filters = INPUT_SIZE // 2**level, BASE_FILTERS * 2**level
+        conv(size, n_in, n_filters)
+        conv(size, n_filters, n_filters)
+        n_in = n_filters
+
+    size = INPUT_SIZE // 2**DEPTH
+    conv(size, n_in, BOTTLENECK_FILTERS)
+    conv(size, BOTTLENECK_FILTERS, BOTTLENECK_FILTERS)
+    n_in = BOTTLENECK_FILTERS
+
+    for level in reversed(range(DEPTH)):
+        size, n_filters = INPUT_SIZE // 2**level, BASE_FILTERS * 2**level
+        conv(size // 2, n_in, n_filters)#transposed convolution, one kernel per input pixel
+        conv(size, 2 * n_filters, n_filters)
+        conv(size, n_filters, n_filters)
+        n_in = n_filters
+
+    conv(INPUT_SIZE, n_in, N_CLASSES, kernel=1)
+    return {'params': params, 'flops': flops}
+
+
+class InputTimer:
+    # Times at which the training pipeline had each batch ready, in the order fit consumes them
+    def __init__(self):
+        self.ready = collections.deque()
+
+    def stamp(self):
+        self.ready.append(time.perf_counter())
+        return 0.0
+
+
+def timed_batches(dataset, timer):
+    # dataset with every batch stamped by timer when it is ready, before the final prefetch buffer.
+    # The stamp is a py_function, so the pipeline is only wrapped while profiling
+    tf = _tf()
+
+    def stamp(images, masks):
+        with tf.control_dependencies([tf.py_function(timer.stamp, [], tf.float64)]):
+            return tf.identity(images), tf.identity(masks)
+    return dataset.map(stamp).prefetch(buffer_size=tf.data.experimental.AUTOTUNE)
+
+
+def phase_callback(timer):
+    # Splits every epoch into the time train steps waited for their batch (input), the rest of the
+    # train steps (compute) and the time between steps (callbacks and Keras bookkeeping). A step whose
+    # batch was ready after the step started waited for the difference
+    tf = _tf()
+
+    class PhaseCallback(tf.keras.callbacks.Callback):
+        def on_epoch_begin(self, epoch, logs=None):
+            self.epoch_start = self.last_end = time.perf_counter()
+            self.between = self.steps = self.wait = 0.0
+
+        def on_train_batch_begin(self, batch, logs=None):
+            self.batch_start = time.perf_counter()
+            self.between += self.batch_start - self.last_end
+
+        def on_train_batch_end(self, batch, logs=None):
+            self.last_end = time.perf_counter()
+            step = self.last_end - self.batch_start
+            ready = timer.ready.popleft() if timer.ready else self.batch_start
+            wait = min(max(ready - self.batch_start, 0.0), step)
+            self.wait += wait
+            self.steps += step - wait
+
+        def on_epoch_end(self, epoch, logs=None):
+            profiling.record('segmentation.input_wait', self.epoch_start, self.wait, epoch=epoch)
+            profiling.record('segmentation.train_steps', self.epoch_start, self.steps, epoch=epoch)
+            profiling.record('segmentation.between_steps', self.epoch_start, self.between, epoch=epoch)
+
+    return PhaseCallback()
+
+
+def architecture(candidate):
+    # build_unet_model keyword arguments of a candidate, candidates without them get the original network
+    return {'BASE_FILTERS': candidate.get('BaseFilters', BASE_FILTERS), 'DEPTH': candidate.get('Depth', DEPTH),
+            'BOTTLENECK_FILTERS': candidate.get('BottleneckFilters', BOTTLENECK_FILTERS),
+            'INPUT_SIZE': candidate.get('InputSize', INPUT_SIZE)}
+
+
+def training_the_model(info, train_batches, test_batches, LEARNING_RATE, BATCH_SIZE, EPOCHS, POOLING_TYPE, DROPOUT_RATE,
+                       validate=True, SEED=None, **ARCHITECTURE):
+    # ARCHITECTURE are the size arguments of build_unet_model, SEED seeds its layers
+    tf = _tf()
+    with profiling.phase('segmentation.build'):
+        unet_model = build_unet_model(POOLING_TYPE, DROPOUT_RATE, SEED=SEED, **ARCHITECTURE)
+        unet_model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate = LEARNING_RATE),
+                           loss="sparse_categorical_crossentropy",
+                           metrics="accuracy")
+
+    TRAIN_LENGTH = info.splits["train"].num_examples
+    STEPS_PER_EPOCH = TRAIN_LENGTH // BATCH_SIZE
+
+    VAL_SUBSPLITS = 5
+    TEST_LENTH = info.splits["test"].num_examples
+    VALIDATION_STEPS = TEST_LENTH // BATCH_SIZE // VAL_SUBSPLITS
+
+    # The search scores candidates with validation_metrics() afterwards and passes validate=False
+    # to skip the per-epoch validation pass
+    validation = {'validation_steps': VALIDATION_STEPS, 'validation_data': test_batches} if validate else {}
+
+    callbacks = []
+    if profiling.enabled():
+        timer = InputTimer()
+        train_batches = timed_batches(train_batches, timer)
+        callbacks.append(phase_callback(timer))
+    with profiling.phase('segmentation.fit', epochs=EPOCHS, batch_size=BATCH_SIZE):
+        model_history = unet_model.fit(train_batches,
+                                       epochs=EPOCHS,
+                                       steps_per_epoch=STEPS_PER_EPOCH,
+                                       callbacks=callbacks,
+                                       **validation)
+    return model_history
+
+
+def validation_metrics(model, batches):
+    # Pixel accuracy, per-class IoU and mean IoU of model over (images, masks) batches, streamed
+    # batch by batch through one confusion matrix
+    metrics = SegmentationMetrics(model.output_shape[-1])
+    for images, masks in batches:
+        metrics.update_probs(masks.numpy(), model.predict_on_batch(images))
+    return metrics.result()
+
+
+def inference_latency(model, image_batch, repeats=5):
+    # Seconds per predicted batch, after one warm-up call
+    model.predict_on_batch(image_batch)
+    start = time.perf_counter()
+    for n in range(repeats):
+        model.predict_on_batch(image_batch)
+    return (time.perf_counter() - start) / repeats
+
+
+LATENCY_BATCH_SIZE = 64
+
+
+def evaluate(candidate):
+    # Evaluator for the ABC drivers and trial_queue workers: train one candidate, report validation
+    # pixel accuracy ('accuracy'), per-class and mean IoU, parameter count, FLOPs per image, training
+    # steps and seconds (build and fit only) and inference latency per batch. A 'Seed' set by a seeded search seeds the layers and the
+    # batch order of this model only, 'ValidationShards' scores on that many validation shards instead of the whole split.
+    seed = candidate.get('Seed')
+    info, train_batches, validation_batches, test_batches = load_batches(candidate['BatchSize'])
+    if seed is not None:
+        train_batches = shuffled_batches(candidate['BatchSize'], seed)
+    start = time.perf_counter()
+    model_history = training_the_model(info, train_batches, test_batches, candidate['LearningRate'], candidate['BatchSize'],
+                                       candidate['Epochs'], candidate['PoolingType'], candidate['DropoutRate'],
+                                       validate=False, SEED=seed, **architecture(candidate))
+    train_time = time.perf_counter() - start
+    shards = candidate.get('ValidationShards')
+    with profiling.phase('segmentation.validate', shards=shards):
+        metrics = validation_metrics(model_history.model, validation_shards(candidate['BatchSize'], shards))
+    steps = candidate['Epochs'] * (info.splits["train"].num_examples // candidate['BatchSize'])
+    latency_batch = next(iter(load_batches(LATENCY_BATCH_SIZE)[3]))[0]
+    return {'accuracy': metrics['pixel_accuracy'], 'mean_iou': metrics['mean_iou'], 'iou': metrics['iou'],
+            'validation_pixels': metrics['pixels'], 'train_accuracy': history_accuracy(model_history), 'steps': steps,
+            'train_time': train_time,
+            'params': model_history.model.count_params(), 'flops': unet_cost(**architecture(candidate))['flops'],
+            'latency': inference_latency(model_history.model, latency_batch)}
+
+
+def display(display_list):
+    tf = _tf()
+    plt = importlib.import_module('matplotlib.pyplot')
+    plt.figure(figsize=(15, 15))
+    title = ["Input Image", "True Mask", "Predicted Mask"]
+    for i in range(len(display_list)):
+        plt.subplot(1, len(display_list), i+1)
+        plt.title(title[i])
+        plt.imshow(tf.keras.utils.array_to_img(display_list[i]))
+        plt.axis("off")
+    plt.show()
@@ -0,0 +1,207 @@
+import importlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from .abc_search import measure
+
+# SQLite-backed trial queue. The ABC driver publishes candidate hyperparameter sets, any number of
+# worker processes, on this machine or on other hosts mounting the same file, claim them with a
+# lease, train and write back the accuracy and timings measured in the worker. A trial whose lease
+# runs out without a heartbeat, or whose evaluation raised, is re-queued until it has been tried
+# max_attempts times.
+#
+# The database uses SQLite's rollback journal, not WAL: WAL needs memory shared between the processes
+# and doesn't work across hosts. Claims are serialized by POSIX advisory locks on the database file,
+# so shared storage has to support them (NFSv4 with locking enabled, CephFS, Lustre mounted with
+# -o flock; not NFS mounted with nolock or SMB without byte-range locks). Leases are wall-clock
+# times, so the hosts' clocks have to agree to well within a lease (NTP).
+#
+#   driver:  evaluate = remote_evaluator('trials.db'); abc_async(evaluate, n_workers=4)
+#   workers: bio-opt worker trials.db --evaluate bio_optimization.segmentation:evaluate
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    candidate TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS trials_status ON trials (status, id);
+"""
+
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=DELETE')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def publish(path, candidate):
+    conn = connect(path)
+    try:
+        cur = conn.execute('INSERT INTO trials (candidate, created) VALUES (?, ?)', (json.dumps(candidate), time.time()))
+        return cur.lastrowid
+    finally:
+        conn.close()
+
+
+def requeue_expired(conn, max_attempts=3):
+    # Leases that ran out go back to the queue, unless the trial already failed max_attempts times
+    now = time.time()
+    conn.execute("UPDATE trials SET status = 'failed', error = 'lease expired', worker = NULL "
+                 "WHERE status = 'running' AND lease_until < ? AND attempts >= ?", (now, max_attempts))
+    cur = conn.execute("UPDATE trials SET status = 'queued', worker = NULL, lease_until = NULL "
+                       "WHERE status = 'running' AND lease_until < ?", (now,))
+    return cur.rowcount
+
+
+def claim(path, worker, lease=600, max_attempts=3):
+    # Atomically take the oldest queued trial, returns (trial_id, candidate) or None
+    conn = connect(path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        requeue_expired(conn, max_attempts)
+        row = conn.execute("SELECT id, candidate FROM trials WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+        if row is None:
+            conn.execute('COMMIT')
+            return None
+        now = time.time()
+        conn.execute("UPDATE trials SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1, "
+                     "started = ? WHERE id = ?", (worker, now + lease, now, row[0]))
+        conn.execute('COMMIT')
+        return row[0], json.loads(row[1])
+    finally:
+        conn.close()
+
+
+def renew(path, trial_id, worker, lease=600):
+    # Heartbeat, returns False if the trial was taken away from this worker
+    conn = connect(path)
+    try:
+        cur = conn.execute("UPDATE trials SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                           (time.time() + lease, trial_id, worker))
+        return cur.rowcount == 1
+    finally:
+        conn.close()
+
+
+def fail(path, trial_id, worker, error, max_attempts=3):
+    # A trial whose evaluation raised goes back to the queue, or fails for good after max_attempts tries
+    conn = connect(path)
+    try:
+        cur = conn.execute("UPDATE trials SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, "
+                           "worker = NULL, lease_until = NULL, error = ?, "
+                           "finished = CASE WHEN attempts < ? THEN NULL ELSE ? END "
+                           "WHERE id = ? AND worker = ? AND status = 'running'",
+                           (max_attempts, error, max_attempts, time.time(), trial_id, worker))
+        return cur.rowcount == 1
+    finally:
+        conn.close()
+
+
+def complete(path, trial_id, worker, result=None, error=None):
+    # The first result to arrive wins, a late duplicate from an expired lease is dropped
+    conn = connect(path)
+    try:
+        status = 'failed' if error is not None else 'done'
+        cur = conn.execute("UPDATE trials SET status = ?, worker = ?, result = ?, error = ?, finished = ?, "
+                           "lease_until = NULL WHERE id = ? AND status IN ('queued', 'running')",
+                           (status, worker, json.dumps(result), error, time.time(), trial_id))
+        return cur.rowcount == 1
+    finally:
+        conn.close()
+
+
+def fetch(path, trial_id):
+    conn = connect(path)
+    try:
+        row = conn.execute('SELECT status, result, error FROM trials WHERE id = ?', (trial_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        raise KeyError(trial_id)
+    return row[0], (json.loads(row[1]) if row[1] is not None else None), row[2]
+
+
+def remote_evaluator(path, poll=1.0, timeout=None):
+    # evaluate() for abc/abc_async that publishes the candidate and blocks until a worker is done with it,
+    # the returned measurement carries the worker's wall time and peak RSS. A trial that failed on every
+    # attempt comes back with accuracy 0 and its 'error', so one broken candidate doesn't end the search.
+    # Run abc_async with n_workers equal to the number of worker processes to keep them all busy.
+    connect(path).close()
+
+    def evaluate(candidate):
+        trial_id = publish(path, candidate)
+        start = time.time()
+        while True:
+            status, result, error = fetch(path, trial_id)
+            if status == 'done':
+                return result
+            if status == 'failed':
+                return {'accuracy': 0.0, 'error': 'trial %d failed: %s' % (trial_id, error)}
+            if timeout is not None and time.time() - start > timeout:
+                raise TimeoutError('trial %d not finished after %.0f s' % (trial_id, timeout))
+            time.sleep(poll)
+
+    return evaluate
+
+
+def worker(path, evaluate, name=None, lease=600, poll=1.0, max_trials=None, max_attempts=3):
+    # Claim, train, write back. A heartbeat thread renews the lease while the trial runs.
+    if name is None:
+        name = '%s:%d' % (socket.gethostname(), os.getpid())
+    done = 0
+    while max_trials is None or done < max_trials:
+        trial = claim(path, name, lease, max_attempts)
+        if trial is None:
+            time.sleep(poll)
+            continue
+        trial_id, candidate = trial
+
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(lease / 3):
+                if not renew(path, trial_id, name, lease):
+                    break
+
+        beat = threading.Thread(target=heartbeat, daemon=True)
+        beat.start()
+        try:
+            measurement = measure(evaluate, candidate)
+        except Exception as e:
+            fail(path, trial_id, name, '%s: %s' % (type(e).__name__, e), max_attempts)
+        else:
+            complete(path, trial_id, name, result=measurement)
+        finally:
+            stop.set()
+            beat.join()
+        done = done + 1
+    return done
+
+
+def load_callable(spec):
+    # 'package.module:function'
+    module, _, attr = spec.partition(':')
+    return getattr(importlib.import_module(module), attr)
+
+
+def status(path):
+    # Number of trials by status
+    conn = connect(path)
+    try:
+        return dict(conn.execute('SELECT status, COUNT(*) FROM trials GROUP BY status').fetchall())
+    finally:
+        conn.close()
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+
+from bio_optimization.ledger import Ledger, read_ledger, storage
+
+
+def rows(n):
+    for i in range(n):
+        row = {'generation': i // 4, 'phase': ['employed', 'onlooker', 'scout'][i % 3], 'bee': i % 5,
+               'accuracy': i / 10, 'cache_hit': i % 2 == 0}
+        if i >= 5:
+            row['LearningRate'] = 0.001 * i#Column first seen after 5 rows
+        yield row
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'trials.ledger')
+    with Ledger(path, chunk=3) as ledger:
+        for row in rows(10):
+            ledger.append(row)
+        assert len(ledger) == 10
+
+    trials = read_ledger(path)
+    assert len(trials) == 10
+    assert list(trials['generation']) == [i // 4 for i in range(10)]
+    assert list(trials['phase']) == [['employed', 'onlooker', 'scout'][i % 3] for i in range(10)]
+    assert list(trials['cache_hit']) == [int(i % 2 == 0) for i in range(10)]
+    np.testing.assert_array_equal(trials['accuracy'], np.arange(10) / 10)
+    assert np.all(np.isnan(trials['LearningRate'][:5]))
+    np.testing.assert_allclose(trials['LearningRate'][5:], 0.001 * np.arange(5, 10))
+    assert np.all(np.isnan(trials['wall_time']))
+    assert trials.category('phase', 'missing') == -2
+    assert np.sum(trials.codes('phase') == trials.category('phase', 'scout')) == 3
+    assert trials.row(6)['phase'] == 'employed' and trials.row(6)['bee'] == 1
+
+
+def test_reopen_after_truncation(tmp_path):
+    path = str(tmp_path / 'trials.ledger')
+    with Ledger(path, chunk=1) as ledger:
+        for row in rows(8):
+            ledger.append(row)
+
+    # A torn append: half a value of one column and one value short in another
+    with open(os.path.join(path, 'accuracy.bin'), 'ab') as f:
+        f.write(b'\0' * (storage('f8').itemsize // 2))
+    with open(os.path.join(path, 'bee.bin'), 'r+b') as f:
+        f.truncate(7 * storage('i4').itemsize)
+    # A column file written before a crash kept its name out of the schema
+    with open(os.path.join(path, 'Epochs.bin'), 'wb') as f:
+        f.write(b'\1' * 100)
+
+    assert len(read_ledger(path)) == 7
+    with Ledger(path) as ledger:
+        assert len(ledger) == 7
+        ledger.append({'generation': 9, 'phase': 'rank', 'bee': -1, 'accuracy': 0.9, 'Epochs': 3})
+
+    trials = read_ledger(path)
+    assert len(trials) == 8
+    for name in trials.columns:
+        assert os.path.getsize(os.path.join(path, name + '.bin')) == 8 * storage(trials.index[name]['dtype']).itemsize
+    assert list(trials['bee']) == [i % 5 for i in range(7)] + [-1]
+    assert trials['phase'][-1] == 'rank'
+    assert list(trials['Epochs']) == [-1] * 7 + [3]
+    np.testing.assert_array_equal(trials['accuracy'][:7], np.arange(7) / 10)
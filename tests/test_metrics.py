@@ -0,0 +1,42 @@
+import numpy as np
+
+from bio_optimization.metrics import SegmentationMetrics
+
+
+def dense_confusion(masks, preds, classes):
+    confusion = np.zeros((classes, classes), dtype=np.int64)
+    for t, p in zip(masks.ravel(), preds.ravel()):
+        confusion[t, p] += 1
+    return confusion
+
+
+def test_streaming_matches_dense_confusion():
+    rng = np.random.default_rng(0)
+    classes = 4
+    masks = rng.integers(0, classes, (6, 16, 16, 1))
+    masks[masks == 3] = 2#class 3 never occurs in the masks
+    probs = rng.random((6, 16, 16, classes))
+    probs[..., 3] = 0#nor in the predictions
+    preds = probs.argmax(-1)
+
+    metrics = SegmentationMetrics(classes)
+    for n in range(0, 6, 4):
+        metrics.update_probs(masks[n:n + 4], probs[n:n + 4])
+    confusion = dense_confusion(masks, preds, classes)
+    np.testing.assert_array_equal(metrics.confusion, confusion)
+
+    result = metrics.result()
+    assert result['pixels'] == masks.size
+    assert result['pixel_accuracy'] == np.trace(confusion) / masks.size
+    iou = []
+    for c in range(3):
+        t, p = masks.ravel() == c, preds.ravel() == c
+        iou.append(np.sum(t & p) / np.sum(t | p))
+    np.testing.assert_allclose(result['iou'][:3], iou)
+    assert result['iou'][3] is None
+    assert np.isclose(result['mean_iou'], np.mean(iou))
+
+
+def test_empty():
+    result = SegmentationMetrics(3).result()
+    assert result['pixels'] == 0 and result['pixel_accuracy'] == 0.0 and result['mean_iou'] == 0.0
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from bio_optimization.niching import clearing, nicheseeds, speciesconserve
+
+
+def population(n, x_num, seed, spread=1.0):
+    rng = np.random.default_rng(seed)
+    chromo = np.zeros((n, x_num + 3))
+    chromo[:, 0:x_num] = rng.random((n, x_num)) * spread
+    chromo[:, x_num] = rng.integers(0, 20, n)#ties between fitness values
+    return chromo
+
+
+def brute_species(chromo, x_num, sigma):
+    x = chromo[:, 0:x_num]
+    seeds = []
+    species = np.zeros(len(chromo), dtype=int)
+    for i in np.argsort(-chromo[:, x_num], kind='stable'):
+        near = [s for s in seeds if np.sum((x[s] - x[i]) ** 2) < sigma ** 2]
+        if near:
+            species[i] = near[0]
+        else:
+            seeds.append(i)
+            species[i] = i
+    return species, np.array(seeds)
+
+
+def brute_clearing(chromo, x_num, sigma, kappa):
+    species, seeds = brute_species(chromo, x_num, sigma)
+    kept = {}
+    niched = np.full(len(chromo), -np.inf)
+    for i in np.argsort(-chromo[:, x_num], kind='stable'):
+        kept[species[i]] = kept.get(species[i], 0) + 1
+        if kept[species[i]] <= kappa:
+            niched[i] = chromo[i, x_num]
+    return niched
+
+
+def brute_speciesconserve(chromo, seedchromo, x_num, sigma):
+    chromo = chromo.copy()
+    protected = np.zeros(len(chromo), dtype=bool)
+    for n in np.argsort(-seedchromo[:, x_num], kind='stable'):
+        seed = seedchromo[n]
+        worst = -1
+        for j in range(len(chromo)):
+            if not protected[j] and np.sum((chromo[j, 0:x_num] - seed[0:x_num]) ** 2) < sigma ** 2:
+                if worst == -1 or chromo[j, x_num] < chromo[worst, x_num]:
+                    worst = j
+        if worst == -1:
+            free = np.flatnonzero(~protected)
+            if len(free) == 0:
+                break
+            worst = free[np.argmin(chromo[free, x_num])]
+        elif chromo[worst, x_num] >= seed[x_num]:
+            protected[worst] = True
+            continue
+        chromo[worst, :] = seed
+        protected[worst] = True
+    return chromo
+
+
+CASES = [(2, 0.1, 1.0), (3, 0.2, 1.0), (10, 0.5, 1.0), (10, 0.3, 10.0), (40, 1.0, 1.0)]
+
+
+@pytest.mark.parametrize('x_num, sigma, spread', CASES)
+def test_nicheseeds(x_num, sigma, spread):
+    chromo = population(300, x_num, x_num, spread)
+    species, seeds = nicheseeds(chromo, x_num, sigma)
+    expected_species, expected_seeds = brute_species(chromo, x_num, sigma)
+    np.testing.assert_array_equal(species, expected_species)
+    np.testing.assert_array_equal(seeds, expected_seeds)
+
+
+@pytest.mark.parametrize('kappa', [1, 2])
+@pytest.mark.parametrize('x_num, sigma, spread', CASES)
+def test_clearing(x_num, sigma, spread, kappa):
+    chromo = population(300, x_num, x_num, spread)
+    expected = brute_clearing(chromo, x_num, sigma, kappa)
+    np.testing.assert_array_equal(clearing(chromo.copy(), x_num, sigma, kappa)[:, x_num + 1], expected)
+
+
+@pytest.mark.parametrize('x_num, sigma, spread', CASES)
+def test_speciesconserve(x_num, sigma, spread):
+    chromo = population(300, x_num, x_num, spread)
+    seedchromo = population(40, x_num, x_num + 100, spread)
+    expected = brute_speciesconserve(chromo, seedchromo, x_num, sigma)
+    np.testing.assert_array_equal(speciesconserve(chromo.copy(), seedchromo, x_num, sigma), expected)
@@ -0,0 +1,28 @@
+import numpy as np
+
+from bio_optimization.abc_search import abc
+from bio_optimization.pareto_search import pareto_abc
+
+
+def evaluate(candidate):
+    # Deterministic in the candidate and its evaluation seed, like a seeded training run
+    noise = np.random.default_rng(candidate['Seed']).random()
+    accuracy = 1 - abs(np.log10(candidate['LearningRate']) + 2) / 3 - 0.02 * candidate['Depth'] + 0.05 * noise
+    train_time = candidate['Epochs'] * candidate['BaseFilters'] / candidate['BatchSize']
+    return {'accuracy': accuracy, 'latency': candidate['BaseFilters'] * candidate['InputSize'] / 1e3,
+            'train_time': train_time}
+
+
+def test_abc_is_independent_of_workers():
+    results = [abc(evaluate, gy_size=6, gc_size=4, max_gen=4, seed=7, n_workers=n, validation_shards=2)
+               for n in (1, 4)]
+    for key in ('colony', 'fitness', 'L', 'best', 'maxfit', 'record', 'ranking'):
+        np.testing.assert_equal(results[0][key], results[1][key], err_msg=key)
+    assert [m['accuracy'] for m in results[0]['evaluations']] == [m['accuracy'] for m in results[1]['evaluations']]
+
+
+def test_pareto_abc_is_independent_of_workers():
+    results = [pareto_abc(evaluate, N=6, max_gen=4, seed=7, n_workers=n) for n in (1, 4)]
+    for key in ('population', 'front', 'trials'):
+        assert [t['candidate'] for t in results[0][key]] == [t['candidate'] for t in results[1][key]], key
+    assert results[0]['record'] == results[1]['record']
@@ -0,0 +1,85 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bio_optimization import trial_queue
+
+
+def test_concurrent_claims_take_each_trial_once(tmp_path):
+    path = str(tmp_path / 'trials.db')
+    published = [trial_queue.publish(path, {'n': n}) for n in range(60)]
+    start = threading.Barrier(6)
+
+    def drain(name):
+        start.wait()
+        claimed = []
+        while True:
+            trial = trial_queue.claim(path, name)
+            if trial is None:
+                return claimed
+            claimed.append(trial[0])
+            assert trial_queue.complete(path, trial[0], name, result={'accuracy': trial[1]['n']})
+
+    with ThreadPoolExecutor(6) as executor:
+        claimed = [i for ids in executor.map(drain, ['w%d' % n for n in range(6)]) for i in ids]
+    assert sorted(claimed) == published
+    assert trial_queue.status(path) == {'done': 60}
+
+
+def test_expired_lease_is_requeued_and_first_result_wins(tmp_path):
+    path = str(tmp_path / 'trials.db')
+    trial_id = trial_queue.publish(path, {'n': 0})
+    assert trial_queue.claim(path, 'a', lease=-1)[0] == trial_id
+    assert trial_queue.claim(path, 'b')[0] == trial_id
+    assert not trial_queue.renew(path, trial_id, 'a')
+    assert trial_queue.renew(path, trial_id, 'b')
+    assert not trial_queue.fail(path, trial_id, 'a', 'late failure')
+
+    assert trial_queue.complete(path, trial_id, 'a', result={'accuracy': 0.5})
+    assert not trial_queue.complete(path, trial_id, 'b', result={'accuracy': 0.7})
+    assert trial_queue.fetch(path, trial_id) == ('done', {'accuracy': 0.5}, None)
+    assert trial_queue.claim(path, 'c') is None
+
+
+def test_lease_expires_max_attempts_times(tmp_path):
+    path = str(tmp_path / 'trials.db')
+    trial_id = trial_queue.publish(path, {'n': 0})
+    for name in 'abc':
+        assert trial_queue.claim(path, name, lease=-1, max_attempts=3)[0] == trial_id
+    assert trial_queue.claim(path, 'd', max_attempts=3) is None
+    assert trial_queue.fetch(path, trial_id) == ('failed', None, 'lease expired')
+
+
+def test_failed_trial_is_retried_then_reported(tmp_path):
+    path = str(tmp_path / 'trials.db')
+    calls = []
+
+    def evaluate(candidate):
+        calls.append(candidate)
+        raise RuntimeError('out of memory')
+
+    trial_id = trial_queue.publish(path, {'n': 0})
+    assert trial_queue.worker(path, evaluate, name='w', poll=0.01, max_trials=2, max_attempts=2) == 2
+    assert len(calls) == 2
+    assert trial_queue.fetch(path, trial_id) == ('failed', None, 'RuntimeError: out of memory')
+    assert trial_queue.claim(path, 'w') is None
+
+
+def test_remote_evaluator(tmp_path):
+    path = str(tmp_path / 'trials.db')
+    evaluate = trial_queue.remote_evaluator(path, poll=0.01)
+    worker = threading.Thread(target=trial_queue.worker, args=(path, lambda c: c['n'] / 10),
+                              kwargs={'poll': 0.01, 'max_trials': 1})
+    worker.start()
+    assert evaluate({'n': 3})['accuracy'] == 0.3
+    worker.join()
+
+    worker = threading.Thread(target=trial_queue.worker, args=(path, evaluate_fails),
+                              kwargs={'poll': 0.01, 'max_trials': 1, 'max_attempts': 1})
+    worker.start()
+    measurement = evaluate({'n': 4})
+    worker.join()
+    assert measurement['accuracy'] == 0.0 and 'ValueError: bad candidate' in measurement['error']
+
+
+def evaluate_fails(candidate):
+    raise ValueError('bad candidate')